@@ -6,15 +6,21 @@ pre-trained `xvr` registration model on a new, specific CT scan.
 """
 
 # --- Standard Library Imports ---
+import atexit
 import sys
+import threading
 import time
 from pathlib import Path
 
 # --- Third-Party Imports ---
 import napari
 from magicgui import magicgui
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_info
 
+# --- Local Imports ---
+from gui_utils import check_file, import_once, import_wandb, preload
+
 # =============================================================================
 # --- 1. SCRIPT CONFIGURATION (MUST BE EDITED BY THE USER) ---
 # =============================================================================
@@ -34,59 +40,149 @@ DEFAULT_CKPTPATH = Path.home() / "xvr_models" / "pretrained_model.pth"
 # This assumes the script is run from the root of the xvr repository.
 sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
 
-try:
-    from click.testing import CliRunner
-    from xvr.cli import cli
-    print("✅ XVR CLI and CliRunner imported successfully.")
-
-    def run_xvr_finetune_cli(config: dict, run_obj) -> None:
-        """Runs the 'xvr finetune' command programmatically using CliRunner."""
-        runner = CliRunner()
-        args = [
-            "finetune",
-            "-i", config["inpath"],
-            "-o", config["outpath"],
-            "-c", config["ckptpath"],
-            "--lr", str(config["lr"]),
-            "--batch_size", str(config["batch_size"]),
-            "--n_epochs", str(config["n_epochs"]),
-            "--n_batches_per_epoch", str(config["n_batches_per_epoch"]),
-            "--rescale", str(config["rescale"]),
-        ]
-        # Add wandb arguments if a run object is provided
-        if run_obj and config.get("project"):
-            args.extend(["--project", config["project"]])
-            if config.get("name"):
-                args.extend(["--name", config["name"]])
-
-        print(f"Calling XVR finetune CLI with args: {args}")
-        result = runner.invoke(cli, args)
-
-        if result.exit_code != 0:
-            error_message = f"XVR Finetuning failed: {result.exception or result.output}"
-            show_info(error_message)
-            print(f"--- XVR FINETUNING ERROR ---\n{result.output}\n--------------------------")
-            raise result.exception if result.exception else Exception(result.output)
-        else:
-            print("--- XVR FINETUNING OUTPUT ---\n", result.output)
+# Importing xvr pulls in torch and its rendering stack, which takes seconds.
+# It is loaded on demand instead of at module import: in a background thread
+# as soon as the viewer opens (see `build_widget`), or by the first run. wandb
+# is optional (finetuning runs without experiment logging if it's missing) and
+# is loaded the same way.
+@import_once
+def _import_xvr_finetune():
+    """Imports xvr's finetune command once; returns (command, context), or None if missing."""
+    try:
+        import click
+        from xvr.cli import cli
+    except ImportError as e:
+        print("⚠️ WARNING: Could not import from 'xvr' or 'click'. Using a dummy function.")
+        print(f"   Error details: {e}")
+        return None
+    print("✅ XVR CLI imported successfully.")
+    # Resolve the click command and a parent context once; every run
+    # invokes the command's callback through this same context.
+    command = cli.commands["finetune"]
+    return command, click.Context(command, info_name="finetune")
+
+
+def _run_dummy_finetune(config: dict) -> None:
+    """A placeholder function to simulate finetuning if XVR is not found."""
+    print("--- Running DUMMY finetuning function ---")
+    n_epochs = config.get("n_epochs", 3)
+    for i in range(n_epochs):
+        time.sleep(0.5)
+        print(f"  Simulating Finetuning Epoch {i + 1}/{n_epochs}...")
+    print("--- DUMMY finetuning complete ---")
 
-except ImportError as e:
-    show_info(f"Could not import XVR/Click. Using a dummy function. Error: {e}")
-    print(f"⚠️ WARNING: Could not import from 'xvr' or 'click'. Using a dummy function.")
 
-    def run_xvr_finetune_cli(config: dict, run_obj) -> None:
-        """A placeholder function to simulate finetuning if XVR is not found."""
-        print("--- Running DUMMY finetuning function ---")
-        n_epochs = config.get("n_epochs", 3)
-        for i in range(n_epochs):
-            time.sleep(0.5)
-            print(f"  Simulating Finetuning Epoch {i + 1}/{n_epochs}...")
-        print("--- DUMMY finetuning complete ---")
+def run_xvr_finetune_cli(config: dict, run_obj) -> None:
+    """Runs the 'xvr finetune' command in-process with typed keyword arguments."""
+    xvr_finetune = _import_xvr_finetune()
+    if xvr_finetune is None:
+        _run_dummy_finetune(config)
+        return
+    command, context = xvr_finetune
+
+    kwargs = {
+        "inpath": config["inpath"],
+        "outpath": config["outpath"],
+        "ckptpath": config["ckptpath"],
+        "lr": config["lr"],
+        "batch_size": config["batch_size"],
+        "n_epochs": config["n_epochs"],
+        "n_batches_per_epoch": config["n_batches_per_epoch"],
+        "rescale": config["rescale"],
+    }
+    # Add wandb arguments if a run object is provided
+    if run_obj and config.get("project"):
+        kwargs["project"] = config["project"]
+        if config.get("name"):
+            kwargs["name"] = config["name"]
+
+    print(f"Calling XVR finetune with kwargs: {kwargs}")
+    # Context.invoke fills every option not passed here with its CLI default,
+    # so no argv is built or parsed. It runs the callback in a short-lived
+    # sub-context, so reusing the parent is safe. Exceptions propagate.
+    context.invoke(command, **kwargs)
+    print("--- XVR FINETUNING COMPLETE ---")
 
 # =============================================================================
 # --- 3. NAPARI GUI WIDGET DEFINITION ---
 # =============================================================================
 
+# The offline wandb run is created on first use and reused by later finetuning
+# runs with the same project/name/output directory, instead of re-initialized on
+# every click. The lock keeps a worker from finishing a run another one uses.
+_WANDB_RUN_LOCK = threading.Lock()
+_WANDB_RUN = None
+_WANDB_RUN_KEY = None  # (project, name, outpath) of `_WANDB_RUN`
+
+
+def _get_wandb_run(wandb, project: str, name: str, outpath: str):
+    """Returns the session's offline wandb run, (re)creating it only when needed."""
+    global _WANDB_RUN, _WANDB_RUN_KEY
+    with _WANDB_RUN_LOCK:
+        key = (project, name, outpath)
+        if _WANDB_RUN is not None:
+            if _WANDB_RUN_KEY == key:
+                return _WANDB_RUN
+            _WANDB_RUN.finish()
+        # Running in "offline" mode is best for GUIs to prevent hanging.
+        _WANDB_RUN = wandb.init(
+            project=project,
+            name=name,
+            mode="offline",
+            reinit=True,
+            dir=outpath
+        )
+        _WANDB_RUN_KEY = key
+        print("WandB initialized in offline mode. Logs will be in the output directory.")
+        return _WANDB_RUN
+
+
+def _finish_wandb_run() -> None:
+    """Finishes the session's wandb run, if one was started."""
+    global _WANDB_RUN, _WANDB_RUN_KEY
+    with _WANDB_RUN_LOCK:
+        if _WANDB_RUN is not None:
+            _WANDB_RUN.finish()
+            _WANDB_RUN = None
+            _WANDB_RUN_KEY = None
+
+
+# Close the reused run once, when the GUI process exits.
+atexit.register(_finish_wandb_run)
+
+
+@thread_worker
+def _finetune_worker(config: dict) -> None:
+    """Runs the finetuning (and its optional wandb run) off the Qt main thread."""
+    wandb_run = None
+    if config["use_wandb"]:
+        wandb = import_wandb()
+        if wandb is None:
+            print("WandB not found. Finetuning will proceed without logging.")
+        else:
+            wandb_run = _get_wandb_run(wandb, config["project"], config["name"], config["outpath"])
+
+    # Call the main finetuning function
+    run_xvr_finetune_cli(config, wandb_run)
+
+
+def _on_finetune_done(_result) -> None:
+    """Reports a successful finetuning run (called on the Qt main thread)."""
+    show_info("✅ XVR finetuning completed! Check output directory for model weights.")
+
+
+def _on_finetune_error(e: Exception) -> None:
+    """Reports a failed finetuning run (called on the Qt main thread)."""
+    show_info(f"❌ Error during finetuning: {e}")
+    print(f"\n--- ERROR DURING FINETUNING ---\n{e}\n----------------------------")
+
+
+def _on_finetune_finished() -> None:
+    """Re-enables the Start button once a finetuning run ends (called on the Qt main thread)."""
+    print("--- End XVR Finetuning Log ---")
+    xvr_finetune_widget.call_button.enabled = True
+
+
 @magicgui(
     call_button="Start Finetuning",
     layout="vertical",
@@ -98,6 +194,7 @@ except ImportError as e:
     n_epochs={"label": "Number of Epochs", "min": 1, "max": 500},
     n_batches_per_epoch={"label": "Batches per Epoch", "min": 1, "max": 100},
     rescale={"label": "Rescale Virtual Detector", "min": 0.1, "max": 5.0, "step": 0.1},
+    use_wandb={"label": "Log to WandB (offline)"},
 )
 def xvr_finetune_widget(
     inpath: Path = DEFAULT_INPATH,
@@ -108,16 +205,17 @@ def xvr_finetune_widget(
     n_epochs: int = 10,
     n_batches_per_epoch: int = 25,
     rescale: float = 1.0,
+    use_wandb: bool = False,
 ) -> None:
     """A magicgui widget to collect parameters and launch the XVR finetuning process."""
-    show_info("Starting XVR finetuning (this may block the GUI)...")
+    show_info("Starting XVR finetuning in the background (see terminal for output)...")
     print("\n--- XVR Finetuning Log ---")
 
     # --- Input Validation ---
-    if not inpath.is_file():
+    if not check_file(inpath):
         show_info(f"Error: Input CT volume not found at {inpath}")
         return
-    if not ckptpath.is_file():
+    if not check_file(ckptpath):
         show_info(f"Error: Pretrained checkpoint not found at {ckptpath}")
         return
 
@@ -134,40 +232,27 @@ def xvr_finetune_widget(
         "n_epochs": n_epochs,
         "n_batches_per_epoch": n_batches_per_epoch,
         "rescale": rescale,
+        "use_wandb": use_wandb,
         "project": "xvr-napari-gui-finetune", # Hardcoded project for simplicity
         "name": f"finetune_{inpath.stem}", # Example run name
     }
 
     # --- Run Finetuning ---
-    try:
-        # Use wandb for logging if available, otherwise train without it.
-        # Running in "offline" mode is best for GUIs to prevent hanging.
-        wandb_run = None
-        try:
-            import wandb
-            wandb_run = wandb.init(
-                project=config["project"],
-                name=config["name"],
-                mode="offline",
-                reinit=True,
-                dir=str(outpath)
-            )
-            print("WandB initialized in offline mode. Logs will be in the output directory.")
-        except ImportError:
-            print("WandB not found. Finetuning will proceed without logging.")
-
-        # Call the main finetuning function
-        run_xvr_finetune_cli(config, wandb_run)
+    # The worker runs on a background thread so the viewer stays responsive;
+    # its signals are delivered back on the Qt main thread. Only one finetuning
+    # runs at a time: the Start button stays disabled until it ends.
+    xvr_finetune_widget.call_button.enabled = False
+    worker = _finetune_worker(config)
+    worker.returned.connect(_on_finetune_done)
+    worker.errored.connect(_on_finetune_error)
+    worker.finished.connect(_on_finetune_finished)
+    worker.start()
 
-        if wandb_run:
-            wandb_run.finish()
 
-        show_info("✅ XVR finetuning completed! Check output directory for model weights.")
-    except Exception as e:
-        show_info(f"❌ Error during finetuning: {e}")
-        print(f"\n--- ERROR DURING FINETUNING ---\n{e}\n----------------------------")
-        
-    print("--- End XVR Finetuning Log ---")
+def build_widget():
+    """Returns this GUI's widget for docking into an already running viewer, preloading xvr."""
+    preload(_import_xvr_finetune, import_wandb)
+    return xvr_finetune_widget
 
 # =============================================================================
 # --- 4. SCRIPT ENTRYPOINT ---
@@ -179,6 +264,9 @@ if __name__ == "__main__":
     """
     print("Initializing Napari viewer...")
     viewer = napari.Viewer(title="XVR Finetuning GUI")
+
+    # Import xvr in the background while the user fills in the form
+    preload(_import_xvr_finetune, import_wandb)
     
     # Add the widget to the viewer's right dock
     viewer.window.add_dock_widget(xvr_finetune_widget, area='right', name="XVR Finetuning")
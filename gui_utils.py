@@ -0,0 +1,68 @@
+"""
+Helpers shared by the XVR napari GUI scripts.
+
+Path checks that validate a form field with a single system call, and the
+on-demand loading of slow, optional imports (xvr pulls in torch and its
+rendering stack; wandb is slow on its own) so the viewer opens quickly.
+"""
+
+# --- Standard Library Imports ---
+import functools
+import os
+import stat
+import threading
+
+
+def check_file(path):
+    """Return True if `path` is an existing regular file, using a single os.stat call."""
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def check_dir(path):
+    """Return True if `path` is an existing directory, using a single os.stat call."""
+    try:
+        return stat.S_ISDIR(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+def import_once(loader):
+    """
+    Wrap a zero-argument import function so that it runs only once.
+
+    Calls are serialised with a lock, so a preload thread and a worker never
+    import concurrently; every call returns the result of the first one.
+    """
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(loader)
+    def wrapper():
+        with lock:
+            if not result:
+                result.append(loader())
+        return result[0]
+
+    return wrapper
+
+
+@import_once
+def import_wandb():
+    """Import wandb; return the module, or None if it isn't installed."""
+    try:
+        import wandb
+    except ImportError:
+        return None
+    return wandb
+
+
+def preload(*importers):
+    """Start calling `importers` in a daemon thread so the first run doesn't wait for them."""
+    def run():
+        for importer in importers:
+            importer()
+
+    threading.Thread(target=run, name="xvr-preload", daemon=True).start()
@@ -3,31 +3,43 @@ XVR Pose Viewer — Napari Plugin
 
 """
 
-import torch
+import contextlib
+import pickle
 import napari
 import numpy as np
-from pathlib import Path
+from functools import partial
+from pathlib import Path, PosixPath
 from magicgui import magicgui
-from scipy.spatial.transform import Rotation as R_scipy
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_info
 from qtpy.QtCore import Qt
 from qtpy.QtWidgets import (
-    QVBoxLayout,
-    QHBoxLayout,
-    QLabel,
+    QFormLayout,
     QGroupBox,
     QDoubleSpinBox,
 )
 
+from gui_utils import check_file
+
+# ------------------------------------------------------------------------------
+# Allowed Non-Tensor Classes in Parameters Files
+# ------------------------------------------------------------------------------
+# Parameters files are loaded with torch's weights-only unpickler, which rejects
+# any class that is not explicitly allowed. xvr stores input paths alongside the
+# pose tensors; files saved on Python 3.13+ refer to PosixPath as
+# `pathlib._local.PosixPath`, so both spellings are mapped to the local class
+# (see `_weights_only_load` for older torch versions).
+_SAFE_GLOBALS = [
+    (PosixPath, "pathlib.PosixPath"),
+    (PosixPath, "pathlib._local.PosixPath"),
+]
+
 # ------------------------------------------------------------------------------
-# Optional: Handle pathlib._local PosixPath Deserialization
+# 6 DoF Display State
 # ------------------------------------------------------------------------------
-# Uncomment if your `.pt` file was saved on a different OS (e.g. Mac → Linux)
-# to prevent "pathlib._local.PosixPath not found" deserialization errors.
-#
-from pathlib import PosixPath
-import sys, types
-sys.modules['pathlib._local'] = types.SimpleNamespace(PosixPath=PosixPath)
+# Spinboxes built for the 6 DoF display, keyed by the id of the viewer the
+# widget is docked in, so they are created once per viewer lifetime.
+_UI_STATE = {}
 
 # ------------------------------------------------------------------------------
 # Default Parameters File Path
@@ -36,6 +48,159 @@ DEFAULT_PARAMS_FILE = Path(
     "/parameters.pt"
 )
 
+# ------------------------------------------------------------------------------
+# Parameters File Loading (runs on a worker thread)
+# ------------------------------------------------------------------------------
+
+
+def _weights_only_load(torch, parameters_file: Path, mmap: bool):
+    """
+    `torch.load` with the weights-only unpickler and `_SAFE_GLOBALS` allowed.
+
+    Scoped allow-lists need torch 2.5, and `(class, "qualified.name")` entries
+    need torch 2.6. On torch 2.5 only the class itself is allowed, which covers
+    files saved before Python 3.13. Older versions load without an allow-list,
+    so files holding paths are rejected and reported.
+    """
+    safe_globals = getattr(torch.serialization, "safe_globals", None)
+    allowed = _SAFE_GLOBALS if _torch_version(torch) >= (2, 6) else [PosixPath]
+    context = safe_globals(allowed) if safe_globals is not None else contextlib.nullcontext()
+    with context:
+        return torch.load(
+            str(parameters_file), map_location="cpu", weights_only=True, mmap=mmap
+        )
+
+
+def _torch_version(torch):
+    """Return torch's (major, minor) version, e.g. (2, 6) for "2.6.0+cu124"."""
+    major, minor = torch.__version__.split("+")[0].split(".")[:2]
+    return int(major), int(minor)
+
+
+def _load_pose(parameters_file: Path):
+    """
+    Load a `.pt` parameters file and extract the 6 DoF pose.
+
+    Returns a tuple `(euler_angles, translation_vec)` with ZXY Euler angles in
+    degrees and XYZ translations in mm, or None if the file holds no pose data.
+    Raises ValueError for files that cannot be interpreted as a pose.
+    """
+    # torch and the numba-compiled pose kernels are imported here, on the
+    # worker thread, so neither delays napari startup or plugin registration.
+    import torch
+    from pose_math import euler_zxy_to_matrix, matrix_to_euler_zxy
+
+    # Weights-only loading never runs arbitrary pickle code, and mmap maps the
+    # tensor storage lazily instead of reading it all into memory.
+    try:
+        try:
+            data = _weights_only_load(torch, parameters_file, mmap=True)
+        except RuntimeError as e:
+            # Legacy (non-zip) files cannot be mmapped; read those into memory
+            # instead, still with the weights-only unpickler.
+            print(f"Memory-mapped load failed ({e}); retrying without mmap.")
+            data = _weights_only_load(torch, parameters_file, mmap=False)
+    except pickle.UnpicklingError as e:
+        # The file holds objects beyond the allowed classes. It is not fully
+        # unpickled as a fallback, since that could run arbitrary code.
+        raise ValueError(f"File contains data that cannot be loaded safely: {e}") from e
+
+    if not isinstance(data, dict):
+        raise ValueError("Loaded .pt file is not a dictionary.")
+
+    print("Keys found in .pt file:", data.keys())
+
+    final_pose_tensor = None
+
+    # Case 1: final_pose key present directly
+    if "final_pose" in data and isinstance(data["final_pose"], torch.Tensor):
+        final_pose_tensor = data["final_pose"]
+        print("Found 'final_pose' in parameters file.")
+
+    # Case 2: Separate 'rotations' and 'translations'
+    elif "rotations" in data and "translations" in data:
+        # detach() so tensors saved from an autograd graph convert to numpy;
+        # reshape(-1) flattens any singleton batch dimensions in one step.
+        rot_tensor = data["rotations"].detach().cpu().numpy().reshape(-1)
+        trans_tensor = data["translations"].detach().cpu().numpy().reshape(-1)
+
+        if rot_tensor.size == 3 and trans_tensor.size == 3:
+            # Convert Euler angles (radians) → rotation matrix
+            rotation_mat = euler_zxy_to_matrix(
+                np.asarray([rot_tensor], dtype=np.float64)
+            )[0]
+
+            # Build 4x4 homogeneous pose matrix
+            final_pose = np.eye(4)
+            final_pose[:3, :3] = rotation_mat
+            final_pose[:3, 3] = trans_tensor
+            final_pose_tensor = torch.from_numpy(final_pose)
+
+            print("Constructed 'final_pose' from separate rotation/translation tensors.")
+        else:
+            print("Warning: Unexpected tensor shapes — skipping pose extraction.")
+
+    if final_pose_tensor is None:
+        return None
+
+    final_pose_matrix = final_pose_tensor.detach().cpu().squeeze().numpy()
+
+    if final_pose_matrix.shape != (4, 4):
+        raise ValueError(f"Invalid final_pose shape: {final_pose_matrix.shape}")
+
+    # Decompose transformation
+    rotation_matrix = final_pose_matrix[:3, :3]
+    translation_vec = final_pose_matrix[:3, 3]
+
+    # Convert to Euler angles (ZXY convention)
+    euler_angles = np.degrees(
+        matrix_to_euler_zxy(np.asarray([rotation_matrix], dtype=np.float64))[0]
+    )
+
+    return euler_angles, translation_vec
+
+
+@thread_worker
+def _load_pose_worker(parameters_file: Path):
+    """Runs `_load_pose` off the Qt main thread so torch.load never blocks the GUI."""
+    return _load_pose(parameters_file)
+
+
+def _display_pose(state: dict, result) -> None:
+    """Writes a loaded pose into the spinboxes in `state` (called on the Qt main thread)."""
+    if result is None:
+        show_info("Warning: No pose data found in parameters file.")
+        print("Warning: No 'final_pose' or rotation/translation data found.")
+        return
+
+    euler_angles, translation_vec = result
+
+    # Update GUI spinboxes
+    state["rot_spinboxes"]["Z"].setValue(euler_angles[0])
+    state["rot_spinboxes"]["X"].setValue(euler_angles[1])
+    state["rot_spinboxes"]["Y"].setValue(euler_angles[2])
+    state["trans_spinboxes"]["X"].setValue(translation_vec[0])
+    state["trans_spinboxes"]["Y"].setValue(translation_vec[1])
+    state["trans_spinboxes"]["Z"].setValue(translation_vec[2])
+
+    show_info("6 DoF loaded and displayed in GUI.")
+    print("\n6 DoF (from parameters file):")
+    print(
+        f"  Rotations (ZXY deg): "
+        f"Z={euler_angles[0]:.3f}, X={euler_angles[1]:.3f}, Y={euler_angles[2]:.3f}"
+    )
+    print(
+        f"  Translations (XYZ mm): "
+        f"X={translation_vec[0]:.3f}, Y={translation_vec[1]:.3f}, Z={translation_vec[2]:.3f}"
+    )
+
+
+def _on_load_error(e: Exception) -> None:
+    """Reports a parameters file that failed to load (called on the Qt main thread)."""
+    show_info(f"Error processing parameters file: {e}")
+    print(f"Error processing parameters file: {e}")
+
+
 # ------------------------------------------------------------------------------
 # Napari GUI Widget — XVR Pose Viewer
 # ------------------------------------------------------------------------------
@@ -61,53 +226,45 @@ def xvr_pose_viewer_widget(
     """
 
     # --------------------------------------------------------------------------
-    # One-Time UI Setup (on first run)
+    # One-Time UI Setup (first run in each viewer)
     # --------------------------------------------------------------------------
-    if not hasattr(xvr_pose_viewer_widget, "_initialized_ui"):
+    state = _UI_STATE.setdefault(id(viewer), {})
+    if not state:
         # Group box for displaying 6 DoF values
         six_dof_group = QGroupBox(
             "6 Degrees of Freedom (Translations in mm, Rotations in deg)"
         )
-        six_dof_layout = QVBoxLayout()
+        # A single form layout pairs each label with its spinbox
+        six_dof_layout = QFormLayout()
+        six_dof_layout.setLabelAlignment(Qt.AlignRight | Qt.AlignVCenter)
         six_dof_group.setLayout(six_dof_layout)
 
         # --- Rotation Spinboxes (Euler ZXY convention) ---
-        xvr_pose_viewer_widget._rot_spinboxes = {}
+        state["rot_spinboxes"] = {}
         for axis in ["Z", "X", "Y"]:
-            h_layout = QHBoxLayout()
-            label = QLabel(f"Rot {axis}:")
-            label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
             spinbox = QDoubleSpinBox()
             spinbox.setRange(-360.0, 360.0)
             spinbox.setSingleStep(0.01)
             spinbox.setDecimals(3)
             spinbox.setReadOnly(True)
-            h_layout.addWidget(label)
-            h_layout.addWidget(spinbox)
-            six_dof_layout.addLayout(h_layout)
-            xvr_pose_viewer_widget._rot_spinboxes[axis] = spinbox
+            six_dof_layout.addRow(f"Rot {axis}:", spinbox)
+            state["rot_spinboxes"][axis] = spinbox
 
         # --- Translation Spinboxes (XYZ) ---
-        xvr_pose_viewer_widget._trans_spinboxes = {}
+        state["trans_spinboxes"] = {}
         for axis in ["X", "Y", "Z"]:
-            h_layout = QHBoxLayout()
-            label = QLabel(f"Trans {axis}:")
-            label.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
             spinbox = QDoubleSpinBox()
             spinbox.setRange(-5000.0, 5000.0)
             spinbox.setSingleStep(0.01)
             spinbox.setDecimals(3)
             spinbox.setReadOnly(True)
-            h_layout.addWidget(label)
-            h_layout.addWidget(spinbox)
-            six_dof_layout.addLayout(h_layout)
-            xvr_pose_viewer_widget._trans_spinboxes[axis] = spinbox
+            six_dof_layout.addRow(f"Trans {axis}:", spinbox)
+            state["trans_spinboxes"][axis] = spinbox
 
         # Add the 6 DoF group box to the widget layout
         xvr_pose_viewer_widget.native.layout().addWidget(six_dof_group)
-        xvr_pose_viewer_widget._six_dof_group = six_dof_group
-        xvr_pose_viewer_widget._six_dof_layout = six_dof_layout
-        xvr_pose_viewer_widget._initialized_ui = True
+        state["six_dof_group"] = six_dof_group
+        state["six_dof_layout"] = six_dof_layout
         print("Initialized 6 DoF display widgets.")
 
     # --------------------------------------------------------------------------
@@ -117,105 +274,26 @@ def xvr_pose_viewer_widget(
     print(f"\n--- Loading XVR Parameters from: {parameters_file} ---")
 
     # Reset GUI display
-    for spinbox in xvr_pose_viewer_widget._rot_spinboxes.values():
+    for spinbox in state["rot_spinboxes"].values():
         spinbox.setValue(0.0)
-    for spinbox in xvr_pose_viewer_widget._trans_spinboxes.values():
+    for spinbox in state["trans_spinboxes"].values():
         spinbox.setValue(0.0)
 
-    if not parameters_file.is_file():
+    if not check_file(parameters_file):
         show_info(f"Error: Parameters file not found at {parameters_file}")
         print(f"Error: Parameters file not found at {parameters_file}")
         return
 
-    try:
-        # Load file with full deserialization enabled
-        data = torch.load(str(parameters_file), map_location="cpu", weights_only=False)
-
-        if not isinstance(data, dict):
-            show_info("Error: Loaded .pt file is not a dictionary.")
-            print("Error: Loaded .pt file is not a dictionary.")
-            return
-
-        print("Keys found in .pt file:", data.keys())
-
-        final_pose_tensor = None
-
-        # Case 1: final_pose key present directly
-        if "final_pose" in data and isinstance(data["final_pose"], torch.Tensor):
-            final_pose_tensor = data["final_pose"]
-            print("Found 'final_pose' in parameters file.")
-
-        # Case 2: Separate 'rotations' and 'translations'
-        elif "rotations" in data and "translations" in data:
-            rot_tensor = data["rotations"].squeeze().cpu().numpy()
-            trans_tensor = data["translations"].squeeze().cpu().numpy()
-
-            # Ensure correct shapes
-            rot_tensor = np.atleast_1d(rot_tensor)
-            trans_tensor = np.atleast_1d(trans_tensor)
-
-            if rot_tensor.shape == (3,) and trans_tensor.shape == (3,):
-                # Convert Euler angles (radians) → rotation matrix
-                rotation_mat = R_scipy.from_euler("ZXY", rot_tensor, degrees=False).as_matrix()
-
-                # Build 4x4 homogeneous pose matrix
-                final_pose = np.eye(4)
-                final_pose[:3, :3] = rotation_mat
-                final_pose[:3, 3] = trans_tensor
-                final_pose_tensor = torch.from_numpy(final_pose)
-
-                print("Constructed 'final_pose' from separate rotation/translation tensors.")
-            else:
-                show_info("Warning: Unexpected tensor shapes for rotation/translation.")
-                print("Warning: Unexpected tensor shapes — skipping pose extraction.")
-
-        # ----------------------------------------------------------------------
-        # Extract and Display 6 DoF Data
-        # ----------------------------------------------------------------------
-        if final_pose_tensor is not None:
-            final_pose_matrix = final_pose_tensor.squeeze().numpy()
-
-            if final_pose_matrix.shape != (4, 4):
-                show_info(f"Error: Invalid final_pose shape: {final_pose_matrix.shape}")
-                print(f"Error: Invalid final_pose shape: {final_pose_matrix.shape}")
-                return
-
-            # Decompose transformation
-            rotation_matrix = final_pose_matrix[:3, :3]
-            translation_vec = final_pose_matrix[:3, 3]
-
-            # Convert to Euler angles (ZXY convention)
-            euler_angles = R_scipy.from_matrix(rotation_matrix).as_euler("ZXY", degrees=True)
-
-            # Update GUI spinboxes
-            xvr_pose_viewer_widget._rot_spinboxes["Z"].setValue(euler_angles[0])
-            xvr_pose_viewer_widget._rot_spinboxes["X"].setValue(euler_angles[1])
-            xvr_pose_viewer_widget._rot_spinboxes["Y"].setValue(euler_angles[2])
-            xvr_pose_viewer_widget._trans_spinboxes["X"].setValue(translation_vec[0])
-            xvr_pose_viewer_widget._trans_spinboxes["Y"].setValue(translation_vec[1])
-            xvr_pose_viewer_widget._trans_spinboxes["Z"].setValue(translation_vec[2])
-
-            show_info("6 DoF loaded and displayed in GUI.")
-            print("\n6 DoF (from parameters file):")
-            print(
-                f"  Rotations (ZXY deg): "
-                f"Z={euler_angles[0]:.3f}, X={euler_angles[1]:.3f}, Y={euler_angles[2]:.3f}"
-            )
-            print(
-                f"  Translations (XYZ mm): "
-                f"X={translation_vec[0]:.3f}, Y={translation_vec[1]:.3f}, Z={translation_vec[2]:.3f}"
-            )
-
-        else:
-            show_info("Warning: No pose data found in parameters file.")
-            print("Warning: No 'final_pose' or rotation/translation data found.")
+    worker = _load_pose_worker(parameters_file)
+    worker.returned.connect(partial(_display_pose, state))
+    worker.errored.connect(_on_load_error)
+    worker.finished.connect(lambda: print("--- End XVR Parameters ---"))
+    worker.start()
 
-    except Exception as e:
-        show_info(f"Error processing parameters file: {e}")
-        print(f"Error processing parameters file: {e}")
 
-    finally:
-        print("--- End XVR Parameters ---")
+def build_widget():
+    """Returns this GUI's widget, for docking into an already running viewer."""
+    return xvr_pose_viewer_widget
 
 
 # ------------------------------------------------------------------------------
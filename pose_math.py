@@ -0,0 +1,81 @@
+"""
+Batched Euler angle / rotation matrix conversions for XVR poses.
+
+Angles use the intrinsic ZXY convention (scipy's "ZXY"), the default used by
+`xvr` for its Euler angle parameterization. Both kernels work on stacks of
+poses and are JIT-compiled with numba when it is installed; without numba
+they run as plain Python loops with identical results.
+"""
+
+# --- Standard Library Imports ---
+import math
+
+# --- Third-Party Imports ---
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        """Fallback used when numba is not installed: returns the function unchanged."""
+        def decorator(func):
+            return func
+        return decorator
+
+
+@njit(cache=True, fastmath=True)
+def euler_zxy_to_matrix(angles):
+    """
+    Convert ZXY Euler angles to rotation matrices.
+
+    Args:
+        angles: A float64 array of shape (N, 3) holding (z, x, y) in radians.
+
+    Returns:
+        An array of shape (N, 3, 3) with one Rz(z) @ Rx(x) @ Ry(y) per row.
+    """
+    n = angles.shape[0]
+    matrices = np.empty((n, 3, 3))
+    for i in range(n):
+        cz, sz = math.cos(angles[i, 0]), math.sin(angles[i, 0])
+        cx, sx = math.cos(angles[i, 1]), math.sin(angles[i, 1])
+        cy, sy = math.cos(angles[i, 2]), math.sin(angles[i, 2])
+        matrices[i, 0, 0] = cz * cy - sz * sx * sy
+        matrices[i, 0, 1] = -sz * cx
+        matrices[i, 0, 2] = cz * sy + sz * sx * cy
+        matrices[i, 1, 0] = sz * cy + cz * sx * sy
+        matrices[i, 1, 1] = cz * cx
+        matrices[i, 1, 2] = sz * sy - cz * sx * cy
+        matrices[i, 2, 0] = -cx * sy
+        matrices[i, 2, 1] = sx
+        matrices[i, 2, 2] = cx * cy
+    return matrices
+
+
+@njit(cache=True, fastmath=True)
+def matrix_to_euler_zxy(matrices):
+    """
+    Decompose rotation matrices into ZXY Euler angles.
+
+    The inverse of `euler_zxy_to_matrix`, using scipy's ranges: z and y in
+    [-pi, pi] and x in [-pi/2, pi/2]. At gimbal lock (x = ±pi/2) only the sum
+    of z and y is defined, so y is reported as 0.
+
+    Args:
+        matrices: A float64 array of shape (N, 3, 3).
+
+    Returns:
+        An array of shape (N, 3) holding (z, x, y) in radians.
+    """
+    n = matrices.shape[0]
+    angles = np.empty((n, 3))
+    for i in range(n):
+        sx = min(1.0, max(-1.0, matrices[i, 2, 1]))
+        angles[i, 1] = math.asin(sx)
+        if abs(sx) < 1.0 - 1e-9:
+            angles[i, 0] = math.atan2(-matrices[i, 0, 1], matrices[i, 1, 1])
+            angles[i, 2] = math.atan2(-matrices[i, 2, 0], matrices[i, 2, 2])
+        else:
+            angles[i, 0] = math.atan2(matrices[i, 1, 0], matrices[i, 0, 0])
+            angles[i, 2] = 0.0
+    return angles
@@ -1,20 +1,86 @@
 import napari
 from magicgui import magicgui
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_info
 from pathlib import Path
-import sys
-import subprocess
 import os
 
+from gui_utils import check_file, import_once, preload
+
+# Let PyTorch fall back to the CPU for ops missing on Apple's MPS backend. xvr
+# runs in this process, so this only takes effect if torch hasn't been imported
+# yet; it is set here, before the lazy xvr import below can pull torch in.
+os.environ.setdefault("PYTORCH_ENABLE_MPS_FALLBACK", "1")
+
+# Importing xvr pulls in torch and its rendering stack, which takes seconds.
+# It is loaded on demand instead of at module import: in a background thread
+# as soon as the widget is built (see `build_widget`), or by the first run.
+@import_once
+def _import_xvr_cli():
+    """Imports the xvr CLI once; returns the click group, or None if xvr is missing."""
+    try:
+        from xvr.cli import cli
+    except ImportError as e:
+        print(f"⚠️ WARNING: Could not import the xvr CLI. Registration is unavailable. Error: {e}")
+        return None
+    return cli
+
+
+# --- Declarative Argument Schema for 'xvr register dicom' ---
+# (flag, config key, CLI default): passed as `flag value` only when the GUI
+# value differs from the default. renderer/reducefn are not listed because
+# they are always passed (swapped, see the workaround below).
+_DICOM_CLI_OPTIONS = (
+    ("-m", "mask_path", None),
+    ("--crop", "crop", 0),
+    ("--labels", "labels", ""),
+    ("--scales", "scales", "8"),
+    ("--parameterization", "parameterization", "euler_angles"),
+    ("--convention", "convention", "ZXY"),
+    ("--lr_rot", "lr_rot", 0.01),
+    ("--lr_xyz", "lr_xyz", 1.0),
+    ("--patience", "patience", 10),
+    ("--threshold", "threshold", 0.0001),
+    ("--max_n_itrs", "max_n_itrs", 500),
+    ("--max_n_plateaus", "max_n_plateaus", 3),
+    ("--verbose", "verbose_level", 1),
+)
+
+# (flag, config key): boolean switches passed only when enabled.
+_DICOM_CLI_FLAGS = (
+    ("--subtract_background", "subtract_background"),
+    ("--linearize", "linearize"),
+    ("--reverse_x_axis", "reverse_x_axis"),
+    ("--init_only", "init_only"),
+    ("--saveimg", "save_images"),
+)
+
+
+# --- Widget Choices ---
+# Shared, immutable option lists for the dropdowns below.
+_ORIENTATIONS = ("AP", "PA")
+_REDUCEFNS = ("max", "mean", "sum")
+_RENDERERS = ("siddon", "trilinear")
+_PARAMETERIZATIONS = ("euler_angles", "quaternions", "axis_angle", "rotation_6d")
+_CONVENTIONS = ("ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY")
+
+
 # --- XVR CLI Execution Function for 'dicom' mode ---
+@thread_worker
 def run_xvr_register_dicom_cli(config):
     """
-    Executes the 'xvr register dicom' CLI command as a subprocess.
+    Runs the 'xvr register dicom' CLI command in this process.
+
+    Runs on a napari worker thread; xvr writes its progress straight to the
+    console, and any failure is raised to the worker's `errored` signal.
     """
-    show_info("Starting XVR DICOM-Initialized Registration (check console for live output)...")
     print("\n--- XVR DICOM-Initialized Registration Log ---")
 
-    command = ["xvr", "register", "dicom"]
+    xvr_cli = _import_xvr_cli()
+    if xvr_cli is None:
+        raise ImportError("xvr is not installed in this environment.")
+
+    command = ["register", "dicom"]
 
     # Required arguments
     command.extend(["-v", config["volume_path"]])
@@ -26,102 +92,56 @@ def run_xvr_register_dicom_cli(config):
     command.extend(["--renderer", config["reducefn"]])
     command.extend(["--reducefn", config["renderer"]])
 
-    # Optional arguments based on defaults and boolean flags
-    if config["mask_path"]:
-        command.extend(["-m", config["mask_path"]])
-    if config["crop"] != 0:
-        command.extend(["--crop", str(config["crop"])])
-    if config["subtract_background"]:
-        command.append("--subtract_background")
-    if config["linearize"]:
-        command.append("--linearize")
-    # if config["reducefn"] != "max": # This logic is now handled by the workaround
-    #     command.extend(["--reducefn", config["reducefn"]])
-    if config["labels"]:
-        command.extend(["--labels", config["labels"]])
-    if config["scales"] != "8":
-        command.extend(["--scales", config["scales"]])
-    if config["reverse_x_axis"]:
-        command.append("--reverse_x_axis")
-    # if config["renderer"] != "trilinear": # This logic is now handled by the workaround
-    #     command.extend(["--renderer", config["renderer"]])
-    if config["parameterization"] != "euler_angles":
-        command.extend(["--parameterization", config["parameterization"]])
-    if config["convention"] != "ZXY":
-        command.extend(["--convention", config["convention"]])
-    if config["lr_rot"] != 0.01:
-        command.extend(["--lr_rot", str(config["lr_rot"])])
-    if config["lr_xyz"] != 1.0:
-        command.extend(["--lr_xyz", str(config["lr_xyz"])])
-    if config["patience"] != 10:
-        command.extend(["--patience", str(config["patience"])])
-    if config["threshold"] != 0.0001:
-        command.extend(["--threshold", str(config["threshold"])])
-    if config["max_n_itrs"] != 500:
-        command.extend(["--max_n_itrs", str(config["max_n_itrs"])])
-    if config["max_n_plateaus"] != 3:
-        command.extend(["--max_n_plateaus", str(config["max_n_plateaus"])])
-    if config["init_only"]:
-        command.append("--init_only")
-    if config["save_images"]:
-        command.append("--saveimg")
-    if config["verbose_level"] != 1:
-        command.extend(["--verbose", str(config["verbose_level"])])
+    # Optional arguments, only where they differ from the CLI defaults
+    command += [
+        arg
+        for flag, key, default in _DICOM_CLI_OPTIONS
+        if config[key] != default
+        for arg in (flag, str(config[key]))
+    ]
+    command += [flag for flag, key in _DICOM_CLI_FLAGS if config[key]]
 
     # Positional argument XRAY
     command.append(config["dicom_path"])
 
-    print(f"Executing command: {' '.join(command)}")
+    print(f"Calling xvr with args: {' '.join(command)}")
 
     try:
-        env = os.environ.copy()
-        env["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
-
-        process = subprocess.Popen(
-            command,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            env=env,
-            bufsize=1
-        )
-
-        while True:
-            line = process.stdout.readline()
-            if line == '' and process.poll() is not None:
-                break
-            if line:
-                print(line.strip())
-                sys.stdout.flush()
-
-        stderr_output = process.stderr.read()
-        return_code = process.wait()
-
-        if return_code == 0:
-            show_info("XVR Registration completed successfully!")
-            if stderr_output:
-                print("--- STDERR Output ---")
-                print(stderr_output)
-        else:
-            error_message = f"XVR Registration failed with exit code {return_code}."
-            show_info(error_message)
-            print(error_message)
-            if stderr_output:
-                print("--- STDERR Output (Failure) ---")
-                print(stderr_output)
-        
-        return return_code == 0
-
-    except FileNotFoundError:
-        show_info("Error: `xvr` command not found. Make sure your environment is activated.")
-        return False
-    except Exception as e:
-        show_info(f"An unexpected error occurred: {e}")
-        return False
+        # standalone_mode=False makes click raise instead of calling sys.exit,
+        # except for ctx.exit(n), whose exit code is returned instead. A
+        # SystemExit from xvr itself is not an Exception and would escape the
+        # worker without emitting `finished`, so it is converted.
+        try:
+            exit_code = xvr_cli.main(args=command, prog_name="xvr", standalone_mode=False)
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"xvr exited with {e.code!r}.") from None
+            exit_code = 0
+        if isinstance(exit_code, int) and exit_code != 0:
+            raise RuntimeError(f"xvr exited with code {exit_code}.")
     finally:
         print("--- End XVR Registration Log ---")
 
 
+def _on_registration_done(_result):
+    """Report a successful registration (called on the Qt main thread)."""
+    show_info("XVR Registration completed successfully!")
+
+
+def _on_registration_error(e):
+    """Report a registration that failed or could not be run (called on the Qt main thread)."""
+    if isinstance(e, ImportError):
+        show_info("Error: `xvr` could not be imported. Make sure your environment is activated.")
+    else:
+        show_info(f"XVR Registration failed: {e}")
+    print(f"XVR Registration failed: {e}")
+
+
+def _on_registration_finished():
+    """Re-enables the Run button once a registration ends (called on the Qt main thread)."""
+    xvr_register_dicom_widget.call_button.enabled = True
+
+
 # --- The Napari GUI Widget for DICOM-Initialized Registration ---
 @magicgui(
     call_button="Run DICOM-Initialized Registration",
@@ -134,23 +154,23 @@ def run_xvr_register_dicom_cli(config):
     mask_path={"widget_type": "FileEdit", "mode": "r", "label": "Mask Labelmap (-m, optional)"},
     
     # Pose Input
-    orientation={"label": "X-ray Orientation", "choices": ["AP", "PA"]},
+    orientation={"label": "X-ray Orientation", "choices": _ORIENTATIONS},
     
     # Preprocessing
     crop={"label": "X-ray Crop (px)", "min": 0, "max": 1000},
     subtract_background={"label": "Subtract Background"},
     linearize={"label": "Linearize X-ray (exp to linear)"},
-    reducefn={"label": "Multiframe Reduce Function", "choices": ["max", "mean", "sum"]},
+    reducefn={"label": "Multiframe Reduce Function", "choices": _REDUCEFNS},
     
     # Rendering Options
     labels={"label": "Labels to Render (comma-sep)", "tooltip": "e.g., '1,2,3' (uses mask)"},
     reverse_x_axis={"label": "Reverse X-axis (radiologic convention)"},
-    renderer={"label": "Renderer", "choices": ["siddon", "trilinear"]},
+    renderer={"label": "Renderer", "choices": _RENDERERS},
 
     # Optimization Parameters
     scales={"label": "Scales (comma-sep)", "tooltip": "e.g., '8,4,2'"},
-    parameterization={"label": "SO(3) Parameterization", "choices": ["euler_angles", "quaternions", "axis_angle", "rotation_6d"]},
-    convention={"label": "Euler Convention", "choices": ["ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY"]},
+    parameterization={"label": "SO(3) Parameterization", "choices": _PARAMETERIZATIONS},
+    convention={"label": "Euler Convention", "choices": _CONVENTIONS},
     lr_rot={"label": "LR Rotation", "min": 1e-6, "max": 1.0, "step": 1e-4},
     lr_xyz={"label": "LR Translation", "min": 1e-3, "max": 100.0, "step": 0.01},
     patience={"label": "Patience (epochs)", "min": 1, "max": 100},
@@ -200,32 +220,68 @@ def xvr_register_dicom_widget(
     save_images: bool = True,
     verbose_level: int = 1,
 ):
-    # Validate paths
-    if not volume_path.is_file():
+    # Validate paths with one stat call each, stopping at the first missing input.
+    # The X-ray input may be a file or a directory, so any existing path is accepted.
+    if not check_file(volume_path):
         show_info(f"Error: NIfTI Volume not found at {volume_path}")
         return
-    if not dicom_path.exists():
+    if not os.path.exists(dicom_path):
         show_info(f"Error: DICOM X-ray input not found at {dicom_path}")
         return
-    if mask_path and not mask_path.is_file():
+    if mask_path and not check_file(mask_path):
         show_info(f"Error: Mask Labelmap not found at {mask_path}")
         return
 
     output_path.mkdir(parents=True, exist_ok=True)
 
-    config = locals()
-    # Convert Path objects to strings for the subprocess
-    config["volume_path"] = str(config["volume_path"])
-    config["output_path"] = str(config["output_path"])
-    config["dicom_path"] = str(config["dicom_path"])
-    config["mask_path"] = str(config["mask_path"]) if config["mask_path"] else None
+    # Assemble only the fields the CLI builder reads; Paths become strings for the CLI args
+    config = {
+        "volume_path": str(volume_path),
+        "output_path": str(output_path),
+        "dicom_path": str(dicom_path),
+        "mask_path": str(mask_path) if mask_path else None,
+        "orientation": orientation,
+        "crop": crop,
+        "subtract_background": subtract_background,
+        "linearize": linearize,
+        "reducefn": reducefn,
+        "labels": labels,
+        "reverse_x_axis": reverse_x_axis,
+        "renderer": renderer,
+        "scales": scales,
+        "parameterization": parameterization,
+        "convention": convention,
+        "lr_rot": lr_rot,
+        "lr_xyz": lr_xyz,
+        "patience": patience,
+        "threshold": threshold,
+        "max_n_itrs": max_n_itrs,
+        "max_n_plateaus": max_n_plateaus,
+        "init_only": init_only,
+        "save_images": save_images,
+        "verbose_level": verbose_level,
+    }
+
+    # Run the XVR CLI command on a background thread to keep the viewer responsive.
+    # Only one registration runs at a time: the Run button stays disabled until it ends.
+    show_info("Starting XVR DICOM-Initialized Registration (check console for live output)...")
+    xvr_register_dicom_widget.call_button.enabled = False
+    worker = run_xvr_register_dicom_cli(config)
+    worker.returned.connect(_on_registration_done)
+    worker.errored.connect(_on_registration_error)
+    worker.finished.connect(_on_registration_finished)
+    worker.start()
+
 
-    # Run the XVR CLI command
-    run_xvr_register_dicom_cli(config)
+def build_widget():
+    """Return this GUI's widget, for docking into an already running viewer."""
+    preload(_import_xvr_cli)
+    return xvr_register_dicom_widget
 
 
 # --- Main script execution ---
 if __name__ == "__main__":
     viewer = napari.Viewer(title="XVR DICOM-Initialized Registration GUI")
+    preload(_import_xvr_cli)
     viewer.window.add_dock_widget(xvr_register_dicom_widget, area='right', name="DICOM Registration")
     napari.run()
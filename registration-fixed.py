@@ -1,20 +1,116 @@
 import napari
 from magicgui import magicgui
+from magicgui.widgets import PushButton
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_info
+from functools import partial
 from pathlib import Path
 import sys
+import selectors
+import shutil
 import subprocess
 import os
 
+from gui_utils import check_file
+
+# Environment for xvr subprocesses, built once: PyTorch may fall back to the
+# CPU for ops missing on Apple's MPS backend.
+_XVR_ENV = {**os.environ, "PYTORCH_ENABLE_MPS_FALLBACK": "1"}
+
+# --- Declarative Argument Schema for 'xvr register fixed' ---
+# (flag, config key, CLI default): passed as `flag value` only when the GUI
+# value differs from the default.
+_FIXED_CLI_OPTIONS = (
+    ("-m", "mask_path", None),
+    ("--crop", "crop", 0),
+    ("--reducefn", "reducefn", "max"),
+    ("--labels", "labels", ""),
+    ("--scales", "scales", "8"),
+    ("--renderer", "renderer", "trilinear"),
+    ("--parameterization", "parameterization", "euler_angles"),
+    ("--convention", "convention", "ZXY"),
+    ("--lr_rot", "lr_rot", 0.01),
+    ("--lr_xyz", "lr_xyz", 1.0),
+    ("--patience", "patience", 10),
+    ("--threshold", "threshold", 0.0001),
+    ("--max_n_itrs", "max_n_itrs", 500),
+    ("--max_n_plateaus", "max_n_plateaus", 3),
+    ("--verbose", "verbose_level", 1),
+)
+
+# (flag, config key): boolean switches passed only when enabled.
+_FIXED_CLI_FLAGS = (
+    ("--subtract_background", "subtract_background"),
+    ("--linearize", "linearize"),
+    ("--reverse_x_axis", "reverse_x_axis"),
+    ("--init_only", "init_only"),
+    ("--saveimg", "save_images"),
+)
+
+
+def _iter_chunks(pipe, timeout=0.1):
+    """
+    Yields chunks of up to 64 KiB read from `pipe` until EOF.
+
+    Yields None whenever `timeout` seconds pass without output, so the caller
+    gets a chance to run even while the child is silent.
+    """
+    if os.name == "nt":
+        # Windows can't select() on pipes, so fall back to blocking reads.
+        while chunk := pipe.read1(65536):
+            yield chunk
+        return
+    fd = pipe.fileno()
+    os.set_blocking(fd, False)
+    with selectors.DefaultSelector() as selector:
+        selector.register(fd, selectors.EVENT_READ)
+        while True:
+            if not selector.select(timeout):
+                yield None
+                continue
+            # Read the fd directly: a BufferedReader's read1() returns b"" on an
+            # empty non-blocking pipe, which a spurious wakeup would make look
+            # like EOF. os.read raises BlockingIOError then, and returns b""
+            # only at EOF.
+            try:
+                chunk = os.read(fd, 65536)
+            except BlockingIOError:
+                yield None
+                continue
+            if chunk == b"":
+                return
+            yield chunk
+
+
+# --- Widget Choices ---
+# Shared, immutable option lists for the dropdowns below.
+_ORIENTATIONS = ("AP", "PA")
+_REDUCEFNS = ("max", "mean", "sum")
+_RENDERERS = ("siddon", "trilinear")
+_PARAMETERIZATIONS = ("euler_angles", "quaternions", "axis_angle", "rotation_6d")
+_CONVENTIONS = ("ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY")
+
+
+# The registration currently running, if any: its worker and subprocess.
+_ACTIVE_RUN = {}
+
+
 # --- XVR CLI Execution Function for 'fixed' mode ---
-def run_xvr_register_fixed_cli(config):
+@thread_worker(progress={"total": 0, "desc": "XVR Fixed-Pose Registration"})
+def run_xvr_register_fixed_cli(config, run):
     """
     Executes the 'xvr register fixed' CLI command as a subprocess.
+
+    Runs on a napari worker thread. xvr writes its log straight to the console;
+    after each chunk of stderr the latest line is yielded so the progress bar
+    can show it. The subprocess is stored in `run["process"]` so that a cancel
+    can terminate it; a non-zero exit code is raised to the worker's `errored`
+    signal as a CalledProcessError.
     """
-    show_info("Starting XVR Fixed-Pose Registration (check console for live output)...")
     print("\n--- XVR Fixed-Pose Registration Log ---")
 
-    command = ["xvr", "register", "fixed"]
+    # The executable is resolved to an absolute path up front; see the spawn below.
+    command = [shutil.which("xvr", path=_XVR_ENV.get("PATH")) or "xvr", "register", "fixed"]
 
     # Required arguments 
     command.extend(["-v", config["volume_path"]])
@@ -26,98 +122,127 @@ def run_xvr_register_fixed_cli(config):
     command.append("--xyz")
     command.append(f'{config["tx"]},{config["ty"]},{config["tz"]}')
 
-    if config["mask_path"]:
-        command.extend(["-m", config["mask_path"]])
-    if config["crop"] != 0:
-        command.extend(["--crop", str(config["crop"])])
-    if config["subtract_background"]:
-        command.append("--subtract_background")
-    if config["linearize"]:
-        command.append("--linearize")
-    if config["reducefn"] != "max":
-        command.extend(["--reducefn", config["reducefn"]])
-    if config["labels"]:
-        command.extend(["--labels", config["labels"]])
-    if config["scales"] != "8":
-        command.extend(["--scales", config["scales"]])
-    if config["reverse_x_axis"]:
-        command.append("--reverse_x_axis")
-    if config["renderer"] != "trilinear":
-        command.extend(["--renderer", config["renderer"]])
-    if config["parameterization"] != "euler_angles":
-        command.extend(["--parameterization", config["parameterization"]])
-    if config["convention"] != "ZXY":
-        command.extend(["--convention", config["convention"]])
-    if config["lr_rot"] != 0.01:
-        command.extend(["--lr_rot", str(config["lr_rot"])])
-    if config["lr_xyz"] != 1.0:
-        command.extend(["--lr_xyz", str(config["lr_xyz"])])
-    if config["patience"] != 10:
-        command.extend(["--patience", str(config["patience"])])
-    if config["threshold"] != 0.0001:
-        command.extend(["--threshold", str(config["threshold"])])
-    if config["max_n_itrs"] != 500:
-        command.extend(["--max_n_itrs", str(config["max_n_itrs"])])
-    if config["max_n_plateaus"] != 3:
-        command.extend(["--max_n_plateaus", str(config["max_n_plateaus"])])
-    if config["init_only"]:
-        command.append("--init_only")
-    if config["save_images"]:
-        command.append("--saveimg")
-    if config["verbose_level"] != 1:
-        command.extend(["--verbose", str(config["verbose_level"])])
+    # Optional arguments, only where they differ from the CLI defaults
+    command += [
+        arg
+        for flag, key, default in _FIXED_CLI_OPTIONS
+        if config[key] != default
+        for arg in (flag, str(config[key]))
+    ]
+    command += [flag for flag, key in _FIXED_CLI_FLAGS if config[key]]
 
     command.append(config["dicom_path"])
 
     print(f"Executing command: {' '.join(command)}")
 
     try:
-        env = os.environ.copy()
-        env["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
-
+        # stdout is inherited, so xvr's log goes straight to the console. Only
+        # stderr is piped: it carries the tqdm progress shown in the GUI.
+        # Flush first so our own log header is not printed after xvr's output.
+        # On Linux, CPython 3.10+ already starts it with vfork with the default
+        # close_fds=True. macOS has no vfork path, and there an absolute
+        # executable with close_fds=False lets CPython use posix_spawn instead
+        # of forking this (large) GUI process. Python's own fds are
+        # non-inheritable, so none leak into the child.
+        sys.stdout.flush()
         process = subprocess.Popen(
             command,
-            stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
-            text=True,
-            env=env,
-            bufsize=1
+            env=_XVR_ENV,
+            bufsize=65536,
+            close_fds=sys.platform != "darwin",
         )
-
-        while True:
-            line = process.stdout.readline()
-            if line == '' and process.poll() is not None:
-                break
-            if line:
-                print(line.strip())
-                sys.stdout.flush()
-
-        stderr_output = process.stderr.read()
-        return_code = process.wait()
+        run["process"] = process
+
+        try:
+            # Drain stderr in chunks into one buffer, decoded once after exit. Only
+            # the latest complete line of each chunk is decoded, for the progress
+            # bar; `pending` holds the text after the last line break.
+            stderr_buf = bytearray()
+            pending = b""
+            for chunk in _iter_chunks(process.stderr):
+                if chunk is None:
+                    # xvr is quiet; yield anyway so a Cancel is noticed promptly.
+                    yield None
+                    continue
+                stderr_buf += chunk
+                text = pending + chunk
+                end = max(text.rfind(b"\n"), text.rfind(b"\r"))
+                if end < 0:
+                    pending = text
+                    continue
+                pending = text[end + 1:]
+                last = text[:end].rstrip(b"\r\n")
+                start = max(last.rfind(b"\n"), last.rfind(b"\r")) + 1
+                yield last[start:].decode("utf-8", "replace").strip()
+
+            stderr_output = stderr_buf.decode("utf-8", "replace")
+            return_code = process.wait()
+        finally:
+            # Don't leave xvr running if the read loop failed part way through.
+            if process.poll() is None:
+                process.terminate()
 
         if return_code == 0:
-            show_info("XVR Registration completed successfully!")
             if stderr_output:
                 print("--- STDERR Output ---")
                 print(stderr_output)
         else:
             error_message = f"XVR Registration failed with exit code {return_code}."
-            show_info(error_message)
             print(error_message)
             if stderr_output:
                 print("--- STDERR Output (Failure) ---")
                 print(stderr_output)
+            # Not a RuntimeError: superqt's generator worker takes that to mean
+            # the worker was deleted and would emit neither `errored` nor `finished`.
+            raise subprocess.CalledProcessError(return_code, command, stderr=stderr_output)
+
+    finally:
+        print("--- End XVR Registration Log ---")
+        # One flush for the whole run, in case stdout is a file or pipe.
+        sys.stdout.flush()
+
+
+def _on_registration_progress(worker, line):
+    """Show the latest line of xvr output on the progress bar (called on the Qt main thread)."""
+    if line:
+        worker.pbar.set_description(line[:80])
 
-        return return_code == 0
 
-    except FileNotFoundError:
+def _on_registration_done(_result):
+    """Report a successful registration (called on the Qt main thread)."""
+    show_info("XVR Registration completed successfully!")
+
+
+def _on_registration_error(e):
+    """Report a registration that failed or could not be run (called on the Qt main thread)."""
+    if isinstance(e, FileNotFoundError):
         show_info("Error: `xvr` command not found. Make sure your environment is activated.")
-        return False
-    except Exception as e:
+    elif isinstance(e, subprocess.CalledProcessError):
+        show_info(f"XVR Registration failed with exit code {e.returncode}.")
+    else:
         show_info(f"An unexpected error occurred: {e}")
-        return False
-    finally:
-        print("--- End XVR Registration Log ---")
+
+
+def _on_registration_aborted(run):
+    """Terminate the xvr subprocess of a cancelled registration (called on the Qt main thread)."""
+    process = run.get("process")
+    if process is not None and process.poll() is None:
+        process.terminate()
+    show_info("XVR Registration cancelled.")
+
+
+def _on_registration_finished():
+    """Forget the finished run and disable the Cancel button (called on the Qt main thread)."""
+    _ACTIVE_RUN.clear()
+    cancel_button.enabled = False
+
+
+def _cancel_registration():
+    """Ask the running registration worker to stop at its next chunk of output."""
+    worker = _ACTIVE_RUN.get("worker")
+    if worker is not None:
+        worker.quit()
 
 
 # --- The Napari GUI Widget for Fixed-Pose Registration ---
@@ -132,7 +257,7 @@ def run_xvr_register_fixed_cli(config):
     mask_path={"widget_type": "FileEdit", "mode": "r", "label": "Mask Labelmap (-m, optional)"},
 
     # Pose Inputs
-    orientation={"label": "X-ray Orientation", "choices": ["AP", "PA"]},
+    orientation={"label": "X-ray Orientation", "choices": _ORIENTATIONS},
     rx={"label": "Initial Rotation: rx (deg)", "tooltip": "Euler angle for the first axis.", "min": -360.0, "max": 360.0},
     ry={"label": "Initial Rotation: ry (deg)", "tooltip": "Euler angle for the second axis.", "min": -360.0, "max": 360.0},
     rz={"label": "Initial Rotation: rz (deg)", "tooltip": "Euler angle for the third axis.", "min": -360.0, "max": 360.0},
@@ -146,17 +271,17 @@ def run_xvr_register_fixed_cli(config):
     crop={"label": "X-ray Crop (px)", "min": 0, "max": 1000},
     subtract_background={"label": "Subtract Background"},
     linearize={"label": "Linearize X-ray (exp to linear)"},
-    reducefn={"label": "Multiframe Reduce Function", "choices": ["max", "mean", "sum"]},
+    reducefn={"label": "Multiframe Reduce Function", "choices": _REDUCEFNS},
 
     # Rendering Options
     labels={"label": "Labels to Render (comma-sep)", "tooltip": "e.g., '1,2,3' (uses mask)"},
     reverse_x_axis={"label": "Reverse X-axis (radiologic convention)"},
-    renderer={"label": "Renderer", "choices": ["siddon", "trilinear"]},
+    renderer={"label": "Renderer", "choices": _RENDERERS},
 
     # Optimization Parameters
     scales={"label": "Scales (comma-sep)", "tooltip": "e.g., '8,4,2'"},
-    parameterization={"label": "SO(3) Parameterization", "choices": ["euler_angles", "quaternions", "axis_angle", "rotation_6d"]},
-    convention={"label": "Euler Convention", "choices": ["ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY"]},
+    parameterization={"label": "SO(3) Parameterization", "choices": _PARAMETERIZATIONS},
+    convention={"label": "Euler Convention", "choices": _CONVENTIONS},
     lr_rot={"label": "LR Rotation", "min": 1e-6, "max": 1.0, "step": 1e-4},
     lr_xyz={"label": "LR Translation", "min": 1e-3, "max": 100.0, "step": 0.01},
     patience={"label": "Patience (epochs)", "min": 1, "max": 100},
@@ -206,25 +331,80 @@ def xvr_register_fixed_widget(
     save_images: bool = True,
     verbose_level: int = 1,
 ):
-    if not volume_path.is_file():
+    if _ACTIVE_RUN:
+        show_info("A registration is already running. Cancel it or wait for it to finish.")
+        return
+    # Validate paths with one stat call each, stopping at the first missing input.
+    # The X-ray input may be a file or a directory, so any existing path is accepted.
+    if not check_file(volume_path):
         show_info(f"Error: NIfTI Volume not found at {volume_path}")
         return
-    if not dicom_path.exists():
+    if not os.path.exists(dicom_path):
         show_info(f"Error: DICOM X-ray input not found at {dicom_path}")
         return
-    if mask_path and not mask_path.is_file():
+    if mask_path and not check_file(mask_path):
         show_info(f"Error: Mask Labelmap not found at {mask_path}")
         return
 
     output_path.mkdir(parents=True, exist_ok=True)
 
-    config = locals()
-    config["volume_path"] = str(config["volume_path"])
-    config["output_path"] = str(config["output_path"])
-    config["dicom_path"] = str(config["dicom_path"])
-    config["mask_path"] = str(config["mask_path"]) if config["mask_path"] else None
-
-    run_xvr_register_fixed_cli(config)
+    # Assemble only the fields the CLI builder reads; Paths become strings for the subprocess
+    config = {
+        "volume_path": str(volume_path),
+        "output_path": str(output_path),
+        "dicom_path": str(dicom_path),
+        "mask_path": str(mask_path) if mask_path else None,
+        "orientation": orientation,
+        "rx": rx,
+        "ry": ry,
+        "rz": rz,
+        "tx": tx,
+        "ty": ty,
+        "tz": tz,
+        "crop": crop,
+        "subtract_background": subtract_background,
+        "linearize": linearize,
+        "reducefn": reducefn,
+        "labels": labels,
+        "reverse_x_axis": reverse_x_axis,
+        "renderer": renderer,
+        "scales": scales,
+        "parameterization": parameterization,
+        "convention": convention,
+        "lr_rot": lr_rot,
+        "lr_xyz": lr_xyz,
+        "patience": patience,
+        "threshold": threshold,
+        "max_n_itrs": max_n_itrs,
+        "max_n_plateaus": max_n_plateaus,
+        "init_only": init_only,
+        "save_images": save_images,
+        "verbose_level": verbose_level,
+    }
+
+    # Run in the background so the viewer stays responsive; the Cancel button
+    # below stops the worker and terminates the subprocess.
+    show_info("Starting XVR Fixed-Pose Registration (check console for live output)...")
+    run = {}
+    worker = run_xvr_register_fixed_cli(config, run)
+    worker.yielded.connect(partial(_on_registration_progress, worker))
+    worker.returned.connect(_on_registration_done)
+    worker.errored.connect(_on_registration_error)
+    worker.aborted.connect(partial(_on_registration_aborted, run))
+    worker.finished.connect(_on_registration_finished)
+    _ACTIVE_RUN["worker"] = worker
+    cancel_button.enabled = True
+    worker.start()
+
+
+cancel_button = PushButton(text="Cancel Registration", enabled=False)
+cancel_button.changed.connect(_cancel_registration)
+xvr_register_fixed_widget.append(cancel_button)
+
+
+def build_widget():
+    """Return this GUI's widget, for docking into an already running viewer."""
+    return xvr_register_fixed_widget
 
 
 # --- Main script execution ---
@@ -7,7 +7,6 @@ a directory of CT scans.
 """
 
 # --- Standard Library Imports ---
-import os
 import sys
 import time
 from pathlib import Path
@@ -15,8 +14,12 @@ from pathlib import Path
 # --- Third-Party Imports ---
 import napari
 from magicgui import magicgui
+from napari.qt.threading import thread_worker
 from napari.utils.notifications import show_info
 
+# --- Local Imports ---
+from gui_utils import check_dir, import_once, import_wandb
+
 # =============================================================================
 # --- 1. SCRIPT CONFIGURATION (MUST BE EDITED BY THE USER) ---
 # =============================================================================
@@ -42,34 +45,104 @@ DEFAULT_SDD = 1000.0  # Source-to-Detector Distance (mm)
 DEFAULT_HEIGHT = 128  # DRR height (pixels)
 DEFAULT_DELX = 0.2    # DRR pixel size (mm/pixel)
 
+# --- Widget Choices ---
+# Shared, immutable option lists for the dropdowns below.
+_ORIENTATIONS = ("AP", "PA")
+_RENDERERS = ("siddon", "trilinear")
+_PARAMETERIZATIONS = ("euler_angles", "quaternions")
+_CONVENTIONS = ("ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY", "RAS", "LPS")
+_MODEL_NAMES = ("resnet18", "resnet34", "resnet50")
+_NORM_LAYERS = ("batchnorm", "groupnorm", "instancenorm")
+
 # =============================================================================
 # --- 2. XVR LIBRARY SETUP ---
 # =============================================================================
 
-# Add the 'src' directory to Python's path to find the xvr library.
-# This assumes the script is run from the root of the xvr repository.
-sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+def _dummy_train_model(config: dict, run_obj) -> None:
+    """A placeholder function to simulate training if XVR is not found."""
+    print("--- Running DUMMY training function ---")
+    n_epochs = config.get("n_epochs", 3)
+    for i in range(n_epochs):
+        time.sleep(1)  # Simulate work
+        print(f"  Simulating Epoch {i + 1}/{n_epochs}...")
+    print("--- DUMMY training complete ---")
 
-try:
-    from xvr.commands.train import train_model
+
+# Importing xvr pulls in torch and its rendering stack, which takes seconds;
+# wandb is also slow to import. Both are loaded on the first training run
+# instead of at module import, so the viewer opens quickly.
+@import_once
+def _import_train_model():
+    """Imports xvr's `train_model` once, falling back to a dummy if xvr is missing."""
+    # Add the 'src' directory to Python's path to find the xvr library.
+    # This assumes the script is run from the root of the xvr repository.
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+    try:
+        from xvr.commands.train import train_model
+    except ImportError as e:
+        print(f"⚠️ WARNING: Could not import 'train_model' from 'xvr'. Using a dummy function.")
+        print(f"   Error details: {e}")
+        return _dummy_train_model
     print("✅ XVR 'train_model' function imported successfully.")
-except ImportError as e:
-    show_info(f"Could not import XVR. Using a dummy training function. Error: {e}")
-    print(f"⚠️ WARNING: Could not import 'train_model' from 'xvr'. Using a dummy function.")
-    print(f"   Error details: {e}")
-
-    # Define a dummy function so the GUI can still launch for demonstration.
-    def train_model(config: dict, run_obj) -> None:
-        """A placeholder function to simulate training if XVR is not found."""
-        print("--- Running DUMMY training function ---")
-        n_epochs = config.get("n_epochs", 3)
-        for i in range(n_epochs):
-            time.sleep(1)  # Simulate work
-            print(f"  Simulating Epoch {i + 1}/{n_epochs}...")
-        print("--- DUMMY training complete ---")
+    return train_model
 
 # =============================================================================
-# --- 3. NAPARI GUI WIDGET DEFINITION ---
+# --- 3. BACKGROUND TRAINING WORKER ---
+# =============================================================================
+
+@thread_worker
+def _train_worker(config: dict) -> None:
+    """
+    Runs `train_model` on a napari worker thread so the viewer stays responsive.
+
+    Errors are raised to the worker's `errored` signal.
+    """
+    # Use wandb for logging if available, otherwise train without it.
+    # Running in "offline" mode is best practice for GUIs to prevent
+    # the app from hanging while waiting for network requests.
+    train_model = _import_train_model()
+    wandb = import_wandb()
+
+    wandb_run = None
+    if wandb is None:
+        print("WandB not found. Training will proceed without logging.")
+    else:
+        wandb_run = wandb.init(
+            project=config["project"],
+            name=config["name"],
+            mode="offline",
+            reinit=True,
+            dir=config["outpath"]
+        )
+        print("WandB initialized in offline mode. Logs will be in the output directory.")
+
+    # Call the main training function
+    try:
+        train_model(config, wandb_run)
+    finally:
+        if wandb_run:
+            wandb_run.finish()
+
+
+def _on_training_done(_result) -> None:
+    """Report a successful training run (called on the Qt main thread)."""
+    show_info("✅ XVR training completed! Check output directory for model weights.")
+
+
+def _on_training_error(e: Exception) -> None:
+    """Report a failed training run (called on the Qt main thread)."""
+    show_info(f"❌ Error during training: {e}")
+    print(f"\n--- ERROR DURING TRAINING ---\n{e}\n----------------------------")
+
+
+def _on_training_finished() -> None:
+    """Re-enable the Start button once a training run ends (called on the Qt main thread)."""
+    print("--- End XVR Training Log ---")
+    xvr_train_widget.call_button.enabled = True
+
+
+# =============================================================================
+# --- 4. NAPARI GUI WIDGET DEFINITION ---
 # =============================================================================
 
 @magicgui(
@@ -98,14 +171,14 @@ except ImportError as e:
     delx={"label": "DRR Pixel Size (mm/px)", "min": 0.05, "max": 1.0, "step": 0.01},
 
     # --- Model & Rendering Parameters ---
-    renderer={"label": "Renderer", "choices": ["siddon", "trilinear"]},
-    orientation={"label": "CT Orientation", "choices": ["AP", "PA"]},
+    renderer={"label": "Renderer", "choices": _RENDERERS},
+    orientation={"label": "CT Orientation", "choices": _ORIENTATIONS},
     reverse_x_axis={"label": "Reverse X-axis (Radiologic Convention)"},
-    parameterization={"label": "SO(3) Parameterization", "choices": ["euler_angles", "quaternions"]},
-    convention={"label": "Euler Convention", "choices": ["ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY", "RAS", "LPS"]},
-    model_name={"label": "Model Architecture", "choices": ["resnet18", "resnet34", "resnet50"]},
+    parameterization={"label": "SO(3) Parameterization", "choices": _PARAMETERIZATIONS},
+    convention={"label": "Euler Convention", "choices": _CONVENTIONS},
+    model_name={"label": "Model Architecture", "choices": _MODEL_NAMES},
     pretrained={"label": "Use ImageNet Pretrained Weights"},
-    norm_layer={"label": "Normalization Layer", "choices": ["batchnorm", "groupnorm", "instancenorm"]},
+    norm_layer={"label": "Normalization Layer", "choices": _NORM_LAYERS},
 
     # --- Training Hyperparameters ---
     lr={"label": "Learning Rate", "min": 1e-5, "max": 1e-2, "step": 1e-4, "tooltip": "Maximum learning rate for the scheduler."},
@@ -156,11 +229,11 @@ def xvr_train_widget(
     A magicgui widget that collects training parameters and launches the
     XVR training process.
     """
-    show_info("Starting XVR training (this may block the GUI)...")
+    show_info("Starting XVR training in the background (see terminal for output)...")
     print("\n--- XVR Training Log ---")
 
     # --- Input Validation ---
-    if not inpath.is_dir():
+    if not check_dir(inpath):
         show_info(f"Error: Input directory not found at {inpath}")
         return
         
@@ -199,40 +272,24 @@ def xvr_train_widget(
     }
 
     # --- Run Training ---
-    try:
-        # Use wandb for logging if available, otherwise train without it.
-        # Running in "offline" mode is best practice for GUIs to prevent
-        # the app from hanging while waiting for network requests.
-        wandb_run = None
-        try:
-            import wandb
-            wandb_run = wandb.init(
-                project=config["project"],
-                name=config["name"],
-                mode="offline",
-                reinit=True,
-                dir=str(outpath)
-            )
-            print("WandB initialized in offline mode. Logs will be in the output directory.")
-        except ImportError:
-            print("WandB not found. Training will proceed without logging.")
-
-        # Call the main training function
-        train_model(config, wandb_run)
+    # The worker runs on a background thread so the viewer stays responsive;
+    # results are reported through its signals on the main thread. Only one
+    # training runs at a time: the Start button stays disabled until it ends.
+    xvr_train_widget.call_button.enabled = False
+    worker = _train_worker(config)
+    worker.returned.connect(_on_training_done)
+    worker.errored.connect(_on_training_error)
+    worker.finished.connect(_on_training_finished)
+    worker.start()
 
-        if wandb_run:
-            wandb_run.finish()
 
-        show_info("✅ XVR training completed! Check output directory for model weights.")
-    except Exception as e:
-        show_info(f"❌ Error during training: {e}")
-        print(f"\n--- ERROR DURING TRAINING ---\n{e}\n----------------------------")
-        
-    print("--- End XVR Training Log ---")
+def build_widget():
+    """Returns this GUI's widget, for docking into an already running viewer."""
+    return xvr_train_widget
 
 
 # =============================================================================
-# --- 4. SCRIPT ENTRYPOINT ---
+# --- 5. SCRIPT ENTRYPOINT ---
 # =============================================================================
 
 if __name__ == "__main__":
@@ -12,16 +12,29 @@ It features two main panels:
 """
 
 # --- Standard Library Imports --- 
+import asyncio
+import importlib.util
 import os
+import shutil
 import subprocess
 import sys
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from functools import partial
 from pathlib import Path
+from typing import TYPE_CHECKING, Optional
 
 # --- Third-Party Imports ---
-import napari
-from magicgui import magicgui
-from napari.utils.notifications import show_info
-from qtpy.QtWidgets import QGroupBox, QPushButton, QVBoxLayout, QWidget
+# napari, magicgui and Qt are imported where they are first needed (see
+# NAPARI WIDGET DEFINITIONS and the entrypoint), so importing this module for
+# its CLI helpers doesn't load the whole GUI stack.
+if TYPE_CHECKING:
+    import napari
+    from qtpy.QtWidgets import QWidget
+
+# --- Local Imports ---
+from gui_utils import check_file
 
 # =============================================================================
 # --- 1. SCRIPT CONFIGURATION (EDIT YOUR PATHS HERE) ---
@@ -40,116 +53,234 @@ DEFAULT_CHECKPOINT_PATH = Path.home() / "xvr_models" / "model.pth"
 DEFAULT_DICOM_PATH = Path.home() / "xvr_data" / "xray.dcm"
 DEFAULT_OUTPUT_DIR = BASE_DIR / "registration_results"
 
+def _resolve_default(path: Path) -> str:
+    """Returns a default path as an absolute string; the path need not exist."""
+    path = Path(path).expanduser()
+    try:
+        return os.fspath(path.resolve())
+    except (OSError, RuntimeError): # e.g. a symlink loop
+        return os.fspath(path.absolute())
+
+# The defaults above, resolved once at import and handed to the widget as
+# plain strings, so building the widget does no path resolution of its own.
+_DEFAULT_VOLUME_PATH = _resolve_default(DEFAULT_VOLUME_PATH)
+_DEFAULT_CHECKPOINT_PATH = _resolve_default(DEFAULT_CHECKPOINT_PATH)
+_DEFAULT_DICOM_PATH = _resolve_default(DEFAULT_DICOM_PATH)
+_DEFAULT_OUTPUT_DIR = _resolve_default(DEFAULT_OUTPUT_DIR)
+
 # --- Paths to Other GUI Scripts ---
 # Assumes other GUI scripts are in the same directory as this one.
 GUI_FILE_PATHS = {
-    "Train Model": BASE_DIR / "simple_xvr_gui.py",
-    "Fine-tune Model": BASE_DIR / "xvr_finetune_gui.py",
-    "Register Model": BASE_DIR / "xvr_register_withanimation.py",  # This script
-    "Register Model : Dicom": BASE_DIR / "31-7-25registrationdicom.py",
-    "Register Model : Fixed": BASE_DIR / "31-7-25registrationfixed.py",
+    "Train Model": BASE_DIR / "training-gui.py",
+    "Fine-tune Model": BASE_DIR / "finetune_gui.py",
+    "Register Model": BASE_DIR / "xvr_register_gui.py",  # This script
+    "Register Model : Dicom": BASE_DIR / "registration-dicom.py",
+    "Register Model : Fixed": BASE_DIR / "registration-fixed.py",
     "View Results": BASE_DIR / "parameters_display_gui.py",
 }
 
+# --- Dock Titles for the Other GUI Scripts ---
+# Used when a GUI is opened inside this viewer instead of a new process; each
+# script provides its widget through a `build_widget()` function.
+GUI_DOCK_NAMES = {
+    "Train Model": "XVR Model Training",
+    "Fine-tune Model": "XVR Finetuning",
+    "Register Model": "XVR Registration",
+    "Register Model : Dicom": "DICOM Registration",
+    "Register Model : Fixed": "Fixed-Pose Registration",
+    "View Results": "XVR Pose Viewer",
+}
+
 # =============================================================================
 # --- 2. CORE FUNCTIONS ---
 # =============================================================================
 
-def run_xvr_register_cli(config: dict) -> bool:
+# napari's show_info wrapped to always run on the Qt main thread, set on first use.
+_SHOW_INFO = None
+
+def show_info(message: str) -> None:
+    """
+    Shows a napari notification from any thread.
+
+    Registrations report from the background event loop, so the call is
+    marshalled to the Qt main thread. napari and superqt are imported on first use.
+    """
+    global _SHOW_INFO
+    if _SHOW_INFO is None:
+        from napari.utils.notifications import show_info as napari_show_info
+        from superqt.utils import ensure_main_thread
+        _SHOW_INFO = ensure_main_thread(napari_show_info)
+    _SHOW_INFO(message)
+
+@dataclass(frozen=True)
+class XvrRegisterConfig:
+    """
+    The parameters of one `xvr register model` run, as collected by the GUI.
+
+    Paths are already strings for the command line; the optional ones are
+    None when unset. Defaults live in the widget signature, not here.
+    """
+    volume_path: str
+    checkpoint_path: str
+    output_path: str
+    dicom_path: str
+    mask_path: Optional[str]
+    warp_path: Optional[str]
+    crop: int
+    subtract_background: bool
+    linearize: bool
+    reducefn: str
+    invert: bool
+    labels: str
+    reverse_x_axis: bool
+    renderer: str
+    scales: str
+    parameterization: str
+    convention: str
+    lr_rot: float
+    lr_xyz: float
+    patience: int
+    threshold: float
+    max_n_itrs: int
+    max_n_plateaus: int
+    init_only: bool
+    save_images: bool
+    pattern: str
+    verbose_level: int
+
+# Environment for xvr subprocesses, built once: PyTorch may fall back to the
+# CPU for ops missing on Apple's MPS backend.
+_XVR_ENV = {**os.environ, "PYTORCH_ENABLE_MPS_FALLBACK": "1"}
+
+# --- Declarative Argument Schema for `xvr register model` ---
+# (flag, config field, CLI default): passed as `flag value` only when the GUI
+# value differs from the default.
+_REGISTER_CLI_OPTIONS = (
+    ("-m", "mask_path", None),
+    ("--crop", "crop", 0),
+    ("--reducefn", "reducefn", "max"),
+    ("--warp", "warp_path", None),
+    ("--labels", "labels", ""),
+    ("--scales", "scales", "8"),
+    ("--renderer", "renderer", "trilinear"),
+    ("--parameterization", "parameterization", "euler_angles"),
+    ("--convention", "convention", "ZXY"),
+    ("--lr_rot", "lr_rot", 0.01),
+    ("--lr_xyz", "lr_xyz", 1.0),
+    ("--patience", "patience", 10),
+    ("--threshold", "threshold", 0.0001),
+    ("--max_n_itrs", "max_n_itrs", 500),
+    ("--max_n_plateaus", "max_n_plateaus", 3),
+    ("--pattern", "pattern", "*.dcm"),
+    ("--verbose", "verbose_level", 1),
+)
+
+# (flag, config field): boolean switches passed only when enabled.
+_REGISTER_CLI_FLAGS = (
+    ("--subtract_background", "subtract_background"),
+    ("--invert", "invert"),
+    ("--reverse_x_axis", "reverse_x_axis"),
+    ("--init_only", "init_only"),
+    ("--saveimg", "save_images"),
+)
+
+# Event loop that runs registrations in the background, started on first use.
+_XVR_LOOP = None
+
+
+def _get_xvr_loop() -> asyncio.AbstractEventLoop:
+    """Returns the background asyncio loop, starting its thread on first use."""
+    global _XVR_LOOP
+    if _XVR_LOOP is None:
+        _XVR_LOOP = asyncio.new_event_loop()
+        threading.Thread(target=_XVR_LOOP.run_forever, name="xvr-register", daemon=True).start()
+    return _XVR_LOOP
+
+
+async def run_xvr_register_cli(config: XvrRegisterConfig) -> bool:
     """
     Constructs and executes the `xvr register model` command as a subprocess.
 
     This function is optimized for performance and correct terminal display by
-    launching the command inside a pseudo-terminal on macOS/Linux.
+    launching the command inside a pseudo-terminal on macOS/Linux. It runs on
+    the background event loop (see `submit_xvr_register`), so awaiting the
+    subprocess never blocks the Qt event loop.
 
     Args:
-        config: A dictionary containing all parameters from the GUI.
+        config: The parameters collected by the GUI.
 
     Returns:
         True if the command executed successfully, False otherwise.
     """
+    # --- Input Validation ---
+    # Done here rather than in the widget, so slow filesystems never stall the
+    # GUI. One syscall per path: the X-ray input may be a file or a directory,
+    # so only its existence is probed; the others must be regular files.
+    if not check_file(config.volume_path):
+        show_info(f"Error: NIfTI Volume not found at {config.volume_path}")
+        return False
+    if not _exists(config.dicom_path):
+        show_info(f"Error: DICOM X-ray input not found at {config.dicom_path}")
+        return False
+    if not check_file(config.checkpoint_path):
+        show_info(f"Error: Model Checkpoint not found at {config.checkpoint_path}")
+        return False
+
+    # Create the output directory if it doesn't exist
+    try:
+        os.makedirs(config.output_path, exist_ok=True)
+    except OSError as e:
+        show_info(f"Error: Could not create output directory {config.output_path}: {e}")
+        return False
+
     show_info("Starting XVR registration (see terminal for live output)...")
     print("\n--- XVR Registration Log ---")
 
     # Use the 'script' utility (on macOS/Linux) to force a pseudo-terminal.
     # This ensures the tqdm progress bar renders correctly as a single line.
-    command = ["script", "-q", "/dev/null", "xvr", "register", "model"]
+    # The executable is resolved to an absolute path up front; see the spawn below.
+    script = shutil.which("script", path=_XVR_ENV.get("PATH")) or "script"
+    command = [script, "-q", "/dev/null", "xvr", "register", "model"]
 
     # --- Assemble Required Arguments ---
-    command.extend(["-v", config["volume_path"]])
-    command.extend(["-c", config["checkpoint_path"]])
-    command.extend(["-o", config["output_path"]])
+    command.extend(["-v", config.volume_path])
+    command.extend(["-c", config.checkpoint_path])
+    command.extend(["-o", config.output_path])
 
     # --- Assemble Optional Arguments ---
-    # This block adds flags to the command only if their values differ
-    # from the CLI's default, keeping the command clean.
-    if config["mask_path"]:
-        command.extend(["-m", config["mask_path"]])
-    if config["crop"] != 0:
-        command.extend(["--crop", str(config["crop"])])
-    if config["subtract_background"]:
-        command.append("--subtract_background")
-    if config["reducefn"] != "max":
-        command.extend(["--reducefn", config["reducefn"]])
-    if config["warp_path"]:
-        command.extend(["--warp", config["warp_path"]])
-    if config["invert"]:
-        command.append("--invert")
-    if config["labels"]:
-        command.extend(["--labels", config["labels"]])
-    if config["scales"] != "8":
-        command.extend(["--scales", config["scales"]])
-    if config["reverse_x_axis"]:
-        command.append("--reverse_x_axis")
-    if config["renderer"] != "trilinear":
-        command.extend(["--renderer", config["renderer"]])
-    if config["parameterization"] != "euler_angles":
-        command.extend(["--parameterization", config["parameterization"]])
-    if config["convention"] != "ZXY":
-        command.extend(["--convention", config["convention"]])
-    if config["lr_rot"] != 0.01:
-        command.extend(["--lr_rot", str(config["lr_rot"])])
-    if config["lr_xyz"] != 1.0:
-        command.extend(["--lr_xyz", str(config["lr_xyz"])])
-    if config["patience"] != 10:
-        command.extend(["--patience", str(config["patience"])])
-    if config["threshold"] != 0.0001:
-        command.extend(["--threshold", str(config["threshold"])])
-    if config["max_n_itrs"] != 500:
-        command.extend(["--max_n_itrs", str(config["max_n_itrs"])])
-    if config["max_n_plateaus"] != 3:
-        command.extend(["--max_n_plateaus", str(config["max_n_plateaus"])])
-    if config["init_only"]:
-        command.append("--init_only")
-    if config["save_images"]:
-        command.append("--saveimg")
-    if config["pattern"] != "*.dcm":
-        command.extend(["--pattern", config["pattern"]])
-    if config["verbose_level"] != 1:
-        command.extend(["--verbose", str(config["verbose_level"])])
+    # Flags are added only where their values differ from the CLI's default
+    # (see the tables above), keeping the command clean.
+    command += [
+        arg
+        for flag, key, default in _REGISTER_CLI_OPTIONS
+        if getattr(config, key) != default
+        for arg in (flag, str(getattr(config, key)))
+    ]
+    command += [flag for flag, key in _REGISTER_CLI_FLAGS if getattr(config, key)]
 
     # Add the final positional argument (the X-ray path)
-    command.append(config["dicom_path"])
+    command.append(config.dicom_path)
 
     print(f"Executing command: {' '.join(command)}")
 
     try:
-        # Set environment variables for the subprocess
-        env = os.environ.copy()
-        env["PYTORCH_ENABLE_MPS_FALLBACK"] = "1"
-        
         # Launch the subprocess. stdout is not piped, allowing it to print
-        # directly to the terminal for maximum performance.
-        process = subprocess.Popen(
-            command,
-            stderr=subprocess.PIPE, # Capture error messages separately
-            text=True,
-            env=env,
-            encoding='utf-8'
+        # directly to the terminal for maximum performance. On Linux, CPython
+        # 3.10+ already starts it with vfork with the default close_fds=True.
+        # macOS has no vfork path, and there an absolute executable with
+        # close_fds=False lets CPython use posix_spawn instead of forking this
+        # (large) GUI process. Python's own fds are non-inheritable, so none
+        # leak into the child.
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stderr=asyncio.subprocess.PIPE, # Capture error messages separately
+            env=_XVR_ENV,
+            close_fds=sys.platform != "darwin",
         )
 
         # Wait for the process to complete and capture any stderr output
-        _, stderr_output = process.communicate()
+        _, stderr_bytes = await process.communicate()
+        stderr_output = stderr_bytes.decode("utf-8", "replace")
         return_code = process.returncode
 
         # --- Handle Process Completion ---
@@ -179,99 +310,213 @@ def run_xvr_register_cli(config: dict) -> bool:
     finally:
         print("--- End XVR Registration Log ---")
 
-def launch_selected_gui(gui_name: str) -> None:
-    """Launches another GUI script in a new Python process."""
-    file_path = GUI_FILE_PATHS.get(gui_name)
-    if not file_path or not file_path.is_file():
+def submit_xvr_register(config: XvrRegisterConfig) -> Future:
+    """
+    Schedules `run_xvr_register_cli` on the background event loop.
+
+    Returns immediately with a future that resolves to the registration's
+    success flag, so the Qt main thread never waits on it. The widget runs one
+    registration at a time: its Run button stays disabled until the future is done.
+    """
+    return asyncio.run_coroutine_threadsafe(run_xvr_register_cli(config), _get_xvr_loop())
+
+def _exists(path: Path) -> bool:
+    """Returns True if `path` exists, using a single access() call."""
+    return path is not None and os.access(os.fspath(path), os.F_OK)
+
+# GUI scripts already imported into this process, keyed by script path, so
+# reopening a GUI doesn't run its module again.
+_GUI_MODULES = {}
+
+def _load_gui_module(file_path: Path):
+    """
+    Imports the GUI script at `file_path` once and returns the module.
+
+    The scripts only build a viewer under `if __name__ == "__main__":`, so
+    importing them is safe.
+    """
+    if file_path == Path(__file__).resolve():
+        return sys.modules[__name__]
+    module = _GUI_MODULES.get(file_path)
+    if module is None:
+        # Module names can't contain '-', which some of the script names do
+        module_name = "xvr_gui_" + file_path.stem.replace("-", "_")
+        spec = importlib.util.spec_from_file_location(module_name, file_path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        _GUI_MODULES[file_path] = module
+    return module
+
+def _dock_gui(gui_name: str, file_path: Path, viewer: "napari.Viewer") -> None:
+    """
+    Docks the widget of a GUI script into `viewer`, importing the script first.
+
+    The napari, Qt and torch modules the script needs are already loaded here,
+    so this skips the cold start of a new interpreter.
+    """
+    widget = _load_gui_module(file_path).build_widget()
+    try:
+        if widget.native.isVisible():
+            show_info(f"{gui_name} is already open in this window.")
+            return
+    except RuntimeError:
+        # Closing its dock deleted the widget; import a fresh copy of the script
+        _GUI_MODULES.pop(file_path, None)
+        widget = _load_gui_module(file_path).build_widget()
+    viewer.window.add_dock_widget(widget, area='right', name=GUI_DOCK_NAMES[gui_name])
+
+def build_widget():
+    """Returns this GUI's registration widget, for docking into a running viewer."""
+    return _get_register_widget()
+
+def _launch_path(gui_name: str, file_path: Path, viewer: "napari.Viewer" = None) -> None:
+    """
+    Opens the GUI script at `file_path` as a dock widget in `viewer`.
+
+    Falls back to a new Python process if there is no viewer or the script
+    can't be loaded in this one.
+    """
+    if not file_path.is_file():
         show_info(f"Error: GUI file not found for {gui_name}")
         return
+    if viewer is not None:
+        try:
+            _dock_gui(gui_name, file_path, viewer)
+            return
+        except Exception as e:
+            print(f"Could not open {gui_name} in this window ({e}); launching a new process.")
     try:
-        # Launch in a new process so it doesn't block the current Napari window
-        subprocess.Popen([sys.executable, file_path])
+        # Launch in a new process so it doesn't block the current Napari window.
+        # The child gets its own session and no stdin, so it isn't tied to this
+        # terminal; stdout/stderr stay inherited so its log remains visible.
+        subprocess.Popen(
+            [sys.executable, str(file_path)],
+            stdin=subprocess.DEVNULL,
+            start_new_session=True,
+        )
     except Exception as e:
         show_info(f"Failed to launch {gui_name}: {e}")
 
+def launch_selected_gui(gui_name: str, viewer: "napari.Viewer" = None) -> None:
+    """Opens the GUI script listed under `gui_name` in GUI_FILE_PATHS; see `_launch_path`."""
+    file_path = GUI_FILE_PATHS.get(gui_name)
+    if file_path is None:
+        show_info(f"Error: GUI file not found for {gui_name}")
+        return
+    _launch_path(gui_name, file_path, viewer)
+
 # =============================================================================
 # --- 3. NAPARI WIDGET DEFINITIONS ---
 # =============================================================================
 
-def create_launcher_widget() -> QWidget:
+# (gui name, button label, script path) for each launcher button, built once.
+_LAUNCHER_BUTTONS = tuple(
+    (gui_name, f"Launch {gui_name}", file_path)
+    for gui_name, file_path in GUI_FILE_PATHS.items()
+)
+
+def _on_launch_clicked(
+    gui_name: str, file_path: Path, viewer: "napari.Viewer", _checked: bool = False
+) -> None:
+    """Slot shared by the launcher buttons; Qt's `clicked` also passes the checked state."""
+    _launch_path(gui_name, file_path, viewer)
+
+def create_launcher_widget(viewer: "napari.Viewer" = None) -> "QWidget":
     """
     Creates a native Qt widget with buttons to launch other GUI scripts.
-    
+
+    Args:
+        viewer: The viewer the launched GUIs are docked into.
+
     Returns:
         A Qt GroupBox containing the launch buttons.
     """
+    from qtpy.QtWidgets import QGroupBox, QPushButton, QVBoxLayout
+
     launcher_widget = QGroupBox("Launch Other GUIs")
     layout = QVBoxLayout()
-    
-    for gui_name in GUI_FILE_PATHS:
-        button = QPushButton(f"Launch {gui_name}")
-        button.clicked.connect(lambda checked=False, name=gui_name: launch_selected_gui(name))
+
+    # Hold off repaints until every button is in, so the layout settles once
+    launcher_widget.setUpdatesEnabled(False)
+    for gui_name, label, file_path in _LAUNCHER_BUTTONS:
+        button = QPushButton(label)
+        button.clicked.connect(partial(_on_launch_clicked, gui_name, file_path, viewer))
         layout.addWidget(button)
-        
+
     launcher_widget.setLayout(layout)
+    launcher_widget.setUpdatesEnabled(True)
+    launcher_widget.updateGeometry()
     return launcher_widget
 
-@magicgui(
-    call_button="Run XVR Registration",
-    layout="vertical",
+# --- Widget Choices ---
+# Shared, immutable option lists for the dropdowns below.
+_REDUCEFNS = ("max", "mean", "sum")
+_RENDERERS = ("siddon", "trilinear")
+_PARAMETERIZATIONS = ("euler_angles", "quaternions", "axis_angle", "rotation_6d")
+_CONVENTIONS = ("ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY", "RAS", "LPS")
+
+# Widget options for `_xvr_register`, kept as one module-level dict so the
+# decorator arguments are built once, not each time the widget is created.
+_MAGICGUI_OPTS = {
+    "call_button": "Run XVR Registration",
+    "layout": "vertical",
 
     # -- Widget Definitions --
     # Main Paths
-    volume_path={"widget_type": "FileEdit", "mode": "r", "label": "NIfTI Volume (-v)"},
-    checkpoint_path={"widget_type": "FileEdit", "mode": "r", "label": "Model Checkpoint (-c)"},
-    output_path={"widget_type": "FileEdit", "mode": "d", "label": "Output Directory (-o)"},
-    dicom_path={"widget_type": "FileEdit", "mode": "r", "label": "DICOM X-ray (positional)"},
-    mask_path={"widget_type": "FileEdit", "mode": "r", "label": "Mask Labelmap (-m, optional)"},
-    
+    "volume_path": {"widget_type": "FileEdit", "mode": "r", "label": "NIfTI Volume (-v)"},
+    "checkpoint_path": {"widget_type": "FileEdit", "mode": "r", "label": "Model Checkpoint (-c)"},
+    "output_path": {"widget_type": "FileEdit", "mode": "d", "label": "Output Directory (-o)"},
+    "dicom_path": {"widget_type": "FileEdit", "mode": "r", "label": "DICOM X-ray (positional)"},
+    "mask_path": {"widget_type": "FileEdit", "mode": "r", "label": "Mask Labelmap (-m, optional)"},
+
     # Preprocessing
-    crop={"label": "X-ray Crop (px)", "min": 0, "max": 1000},
-    subtract_background={"label": "Subtract Background"},
-    linearize={"label": "Linearize X-ray (exp to linear)"},
-    reducefn={"label": "Multiframe Reduce Function", "choices": ["max", "mean", "sum"]},
-    
+    "crop": {"label": "X-ray Crop (px)", "min": 0, "max": 1000},
+    "subtract_background": {"label": "Subtract Background"},
+    "linearize": {"label": "Linearize X-ray (exp to linear)"},
+    "reducefn": {"label": "Multiframe Reduce Function", "choices": _REDUCEFNS},
+
     # Pose Correction
-    warp_path={"widget_type": "FileEdit", "mode": "r", "label": "Warp Transform File (--warp, optional)"},
-    invert={"label": "Invert Warp"},
+    "warp_path": {"widget_type": "FileEdit", "mode": "r", "label": "Warp Transform File (--warp, optional)"},
+    "invert": {"label": "Invert Warp"},
 
     # Rendering Options
-    labels={"label": "Labels to Render (comma-sep, optional)"},
-    reverse_x_axis={"label": "Reverse X-axis (radiologic convention)"},
-    renderer={"label": "Renderer", "choices": ["siddon", "trilinear"]},
+    "labels": {"label": "Labels to Render (comma-sep, optional)"},
+    "reverse_x_axis": {"label": "Reverse X-axis (radiologic convention)"},
+    "renderer": {"label": "Renderer", "choices": _RENDERERS},
 
     # Optimization Parameters
-    scales={"label": "Scales (comma-sep)"},
-    parameterization={"label": "SO(3) Parameterization", "choices": ["euler_angles", "quaternions", "axis_angle", "rotation_6d"]},
-    convention={"label": "Euler Convention", "choices": ["ZXY", "XYZ", "ZYX", "YXZ", "YZX", "XZY", "RAS", "LPS"]},
-    lr_rot={"label": "LR Rotation", "min": 1e-6, "max": 1.0, "step": 1e-4},
-    lr_xyz={"label": "LR Translation", "min": 1e-3, "max": 100.0, "step": 0.01},
-    patience={"label": "Patience (epochs)", "min": 1, "max": 100},
-    threshold={"label": "Threshold (for LR reduction)", "min": 1e-6, "max": 1.0, "step": 1e-5},
-    max_n_itrs={"label": "Max Iterations/Scale", "min": 1, "max": 2000},
-    max_n_plateaus={"label": "Max Plateaus/Scale", "min": 1, "max": 10},
-    
+    "scales": {"label": "Scales (comma-sep)"},
+    "parameterization": {"label": "SO(3) Parameterization", "choices": _PARAMETERIZATIONS},
+    "convention": {"label": "Euler Convention", "choices": _CONVENTIONS},
+    "lr_rot": {"label": "LR Rotation", "min": 1e-6, "max": 1.0, "step": 1e-4},
+    "lr_xyz": {"label": "LR Translation", "min": 1e-3, "max": 100.0, "step": 0.01},
+    "patience": {"label": "Patience (epochs)", "min": 1, "max": 100},
+    "threshold": {"label": "Threshold (for LR reduction)", "min": 1e-6, "max": 1.0, "step": 1e-5},
+    "max_n_itrs": {"label": "Max Iterations/Scale", "min": 1, "max": 2000},
+    "max_n_plateaus": {"label": "Max Plateaus/Scale", "min": 1, "max": 10},
+
     # Output & Logging
-    init_only={"label": "Initial Pose Only (no refinement)"},
-    save_images={"label": "Save Output Images (--saveimg)"},
-    pattern={"label": "X-ray Pattern (if input is dir)"},
-    verbose_level={"label": "Verbose Level", "min": 0, "max": 3},
-)
-def xvr_register_widget(
+    "init_only": {"label": "Initial Pose Only (no refinement)"},
+    "save_images": {"label": "Save Output Images (--saveimg)"},
+    "pattern": {"label": "X-ray Pattern (if input is dir)"},
+    "verbose_level": {"label": "Verbose Level", "min": 0, "max": 3},
+}
+
+def _xvr_register(
     # --- Function Signature with Type Hints and Defaults ---
     # Main Paths
-    volume_path: Path = DEFAULT_VOLUME_PATH,
-    checkpoint_path: Path = DEFAULT_CHECKPOINT_PATH,
-    output_path: Path = DEFAULT_OUTPUT_DIR,
-    dicom_path: Path = DEFAULT_DICOM_PATH,
+    volume_path: Path = _DEFAULT_VOLUME_PATH,
+    checkpoint_path: Path = _DEFAULT_CHECKPOINT_PATH,
+    output_path: Path = _DEFAULT_OUTPUT_DIR,
+    dicom_path: Path = _DEFAULT_DICOM_PATH,
     mask_path: Path = None,
-    
+
     # Preprocessing
     crop: int = 0,
     subtract_background: bool = False,
     linearize: bool = True,
     reducefn: str = "max",
-    
+
     # Pose Correction
     warp_path: Path = None,
     invert: bool = False,
@@ -291,7 +536,7 @@ def xvr_register_widget(
     threshold: float = 0.0001,
     max_n_itrs: int = 500,
     max_n_plateaus: int = 3,
-    
+
     # Output & Logging
     init_only: bool = False,
     save_images: bool = True,
@@ -299,31 +544,76 @@ def xvr_register_widget(
     verbose_level: int = 1,
 ) -> None:
     """The main magicgui widget for XVR registration."""
-    
-    # --- Input Validation ---
-    if not volume_path.is_file():
-        show_info(f"Error: NIfTI Volume not found at {volume_path}")
-        return
-    if not dicom_path.exists():
-        show_info(f"Error: DICOM X-ray input not found at {dicom_path}")
-        return
-    if not checkpoint_path.is_file():
-        show_info(f"Error: Model Checkpoint not found at {checkpoint_path}")
-        return
-    
-    # Create the output directory if it doesn't exist
-    output_path.mkdir(parents=True, exist_ok=True)
-    
-    # Collect all function parameters into a dictionary for the CLI function
-    config = locals()
-    
-    # Convert Path objects to strings for the command line
-    for key, value in config.items():
-        if isinstance(value, Path):
-            config[key] = str(value) if value else None
 
-    # Run the registration command
-    run_xvr_register_cli(config)
+    # Assemble only the fields the CLI builder reads; Paths become strings for the command line
+    config = XvrRegisterConfig(
+        volume_path=str(volume_path),
+        checkpoint_path=str(checkpoint_path),
+        output_path=str(output_path),
+        dicom_path=str(dicom_path),
+        mask_path=str(mask_path) if mask_path else None,
+        warp_path=str(warp_path) if warp_path else None,
+        crop=crop,
+        subtract_background=subtract_background,
+        linearize=linearize,
+        reducefn=reducefn,
+        invert=invert,
+        labels=labels,
+        reverse_x_axis=reverse_x_axis,
+        renderer=renderer,
+        scales=scales,
+        parameterization=parameterization,
+        convention=convention,
+        lr_rot=lr_rot,
+        lr_xyz=lr_xyz,
+        patience=patience,
+        threshold=threshold,
+        max_n_itrs=max_n_itrs,
+        max_n_plateaus=max_n_plateaus,
+        init_only=init_only,
+        save_images=save_images,
+        pattern=pattern,
+        verbose_level=verbose_level,
+    )
+
+    # Validate and run the registration in the background; the widget returns at once.
+    # One run at a time: the Run button stays disabled until this one ends. The
+    # future completes on the event loop thread, so re-enabling the button is
+    # marshalled back to the Qt main thread.
+    from superqt.utils import ensure_main_thread
+
+    _get_register_widget().call_button.enabled = False
+    future = submit_xvr_register(config)
+    future.add_done_callback(ensure_main_thread(_on_register_finished))
+
+def _on_register_finished(future: Future) -> None:
+    """
+    Re-enables the Run button after a registration ends (called on the Qt main thread).
+
+    Also reports any exception that escaped `run_xvr_register_cli`; nothing
+    else reads the future, so it would otherwise be lost silently.
+    """
+    _get_register_widget().call_button.enabled = True
+    error = future.exception()
+    if error is not None:
+        show_info(f"An unexpected error occurred: {error}")
+        print(f"XVR Registration failed: {error!r}")
+
+# The registration widget, built on first use by `_get_register_widget`.
+_REGISTER_WIDGET = None
+
+def _get_register_widget():
+    """
+    Returns the main magicgui widget for XVR registration, building it once.
+
+    magicgui is imported here rather than at module level, so the widget (and
+    the GUI stack behind it) is only created when a window is actually shown.
+    """
+    global _REGISTER_WIDGET
+    if _REGISTER_WIDGET is None:
+        from magicgui import magicgui
+        _REGISTER_WIDGET = magicgui(_xvr_register, **_MAGICGUI_OPTS)
+    return _REGISTER_WIDGET
 
 # =============================================================================
 # --- 4. SCRIPT ENTRYPOINT ---
@@ -332,18 +622,20 @@ def xvr_register_widget(
 if __name__ == "__main__":
     # This block runs when the script is executed directly via `python <script_name>.py`
     
+    import napari
+
     # 1. Create a Napari viewer instance
     print("Initializing Napari viewer...")
     viewer = napari.Viewer(title="XVR Registration GUI")
     
     # 2. Create the launcher widget from our helper function
-    launcher_panel = create_launcher_widget()
+    launcher_panel = create_launcher_widget(viewer)
     
     # 3. Add the launcher widget to the LEFT side of the viewer
     viewer.window.add_dock_widget(launcher_panel, area='left', name="Launch GUIs")
     
     # 4. Add the main registration magicgui widget to the RIGHT side of the viewer
-    viewer.window.add_dock_widget(xvr_register_widget, area='right', name="XVR Registration")
+    viewer.window.add_dock_widget(_get_register_widget(), area='right', name="XVR Registration")
     
     # 5. Start the Napari event loop to show the GUI
     print("Starting Napari application...")